@@ -1,3 +1,6 @@
+import itertools
+import os
+import queue
 import threading
 import time
 from collections import deque
@@ -16,26 +19,144 @@ import asyncio
 import aiohttp
 import json
 
-async def call_mog(s3_image_url: str, prompt: str, unique_key: int):
-    # s3_image_url: str, prompt: str, unique_key: int
-    # Using one of your existing sample images
-    image_path = "/Users/raphael/Develop/sigma-boi/Caleb.png"  # or "SleepyJoe.png"
-    
-    # Test parameters
-    params = {
-        "image": s3_image_url,
-        "prompt": prompt,
-        "unique_key": unique_key
-    }
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.get("http://127.0.0.1:8000/mog", params=params) as response:
+SELLER_WORKERS = int(os.getenv("SELLER_WORKERS", 4))
+SELLER_QUEUE_SIZE = int(os.getenv("SELLER_QUEUE_SIZE", 100))
+SELLER_MAX_INFLIGHT_MOG = int(os.getenv("SELLER_MAX_INFLIGHT_MOG", 2))
+SELLER_METRICS_INTERVAL = float(os.getenv("SELLER_METRICS_INTERVAL", 60))
+
+MOG_BASE_URL = os.getenv("MOG_BASE_URL", "http://127.0.0.1:8000")
+# "http" calls the API server; "inprocess" runs the /mog pipeline inside the seller,
+# skipping HTTP entirely when the seller is co-located with api.py
+SELLER_MOG_MODE = os.getenv("SELLER_MOG_MODE", "http")
+
+
+class MogClient:
+    """Calls /mog for the seller's worker threads over one long-lived event loop.
+
+    HTTP mode keeps a single pooled keep-alive aiohttp session instead of a new
+    loop, session and TCP connection per job.
+    """
+
+    def __init__(self, base_url: str = MOG_BASE_URL, mode: str = SELLER_MOG_MODE,
+                 max_connections: int = SELLER_MAX_INFLIGHT_MOG):
+        self.base_url = base_url
+        self.mode = mode
+        self._session = None
+        self._api = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._run(self._start(max_connections))
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _start(self, max_connections: int):
+        if self.mode == "inprocess":
+            sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            import api
+            await api.startup()
+            self._api = api
+        else:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=max_connections, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=300),
+            )
+
+    async def _call(self, s3_image_url: str, prompt: str, unique_key: str) -> dict:
+        # Paid deliveries jump ahead of ad-hoc /mog traffic for Gemini quota
+        if self._api is not None:
+            return await self._api.mog(image=s3_image_url, prompt=prompt, unique_key=unique_key, lane="delivery")
+
+        params = {
+            "image": s3_image_url,
+            "prompt": prompt,
+            "unique_key": unique_key,
+            "lane": "delivery",
+        }
+        async with self._session.get(f"{self.base_url}/mog", params=params) as response:
             print("Status Code:", response.status)
-            # print("Response:", await response.json())
-    
-    return f"http://127.0.0.1:8000/evaluation/{unique_key}"
+            response.raise_for_status()
+            return await response.json()
+
+    def call_mog(self, s3_image_url: str, prompt: str, unique_key) -> str:
+        """Run the analysis for unique_key and return the evaluation page url."""
+        result = self._run(self._call(s3_image_url, prompt, str(unique_key)))
+        if "error" in result:
+            raise RuntimeError(f"/mog failed for {unique_key}: {result}")
+        return f"{self.base_url}/evaluation/{unique_key}"
+
+    def close(self):
+        if self._session is not None:
+            self._run(self._session.close())
+        if self._api is not None:
+            self._api.pipeline.shutdown()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+# Lower runs first among the cheap phases; TRANSACTION deliveries have their own queue
+PHASE_PRIORITY = {
+    ACPJobPhase.REQUEST: 0,
+    ACPJobPhase.NEGOTIATION: 0,
+    ACPJobPhase.COMPLETED: 1,
+    ACPJobPhase.REJECTED: 1,
+}
+
+
+class QueueMetrics:
+    """Thread-safe queue depth and wait-time stats for the seller's job queue."""
 
-def seller(use_thread_lock: bool = True):
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=window)
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def on_enqueue(self, depth: int):
+        with self._lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, depth)
+
+    def on_drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def on_dequeue(self, wait_seconds: float):
+        with self._lock:
+            self._waits.append(wait_seconds)
+
+    def on_done(self, ok: bool):
+        with self._lock:
+            self.processed += 1
+            if not ok:
+                self.failed += 1
+
+    def snapshot(self, depth: int) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            counts = (self.enqueued, self.processed, self.failed, self.dropped, self.max_depth)
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 3) if waits else 0.0
+
+        enqueued, processed, failed, dropped, max_depth = counts
+        return {
+            "depth": depth,
+            "max_depth": max_depth,
+            "enqueued": enqueued,
+            "processed": processed,
+            "failed": failed,
+            "dropped": dropped,
+            "wait_p50_s": pct(0.50),
+            "wait_p95_s": pct(0.95),
+            "wait_max_s": round(waits[-1], 3) if waits else 0.0,
+        }
+
+
+def seller():
     env = EnvSettings()
 
     if env.WHITELISTED_WALLET_PRIVATE_KEY is None:
@@ -45,66 +166,52 @@ def seller(use_thread_lock: bool = True):
     if env.SELLER_ENTITY_ID is None:
         raise ValueError("SELLER_ENTITY_ID is not set")
 
-    job_queue = deque()
-    job_queue_lock = threading.Lock()
-    job_event = threading.Event()
+    # Bounded: the SDK calls on_new_task on a fresh thread per event, so blocking there
+    # would only park more threads; when a queue is full the job is turned away instead
+    job_queue = queue.PriorityQueue(maxsize=SELLER_QUEUE_SIZE)
+    # Deliveries are served by their own SELLER_MAX_INFLIGHT_MOG workers, which also caps
+    # concurrent /mog calls, so a burst of them never ties up the workers answering
+    # cheap REQUEST/NEGOTIATION memos
+    delivery_queue = queue.Queue(maxsize=SELLER_QUEUE_SIZE)
+    job_sequence = itertools.count()  # FIFO within a priority
+    metrics = QueueMetrics()
+    mog_client = MogClient()
 
-    def safe_append_job(job, memo_to_sign: Optional[ACPMemo] = None):
-        if use_thread_lock:
-            print(f"[safe_append_job] Acquiring lock to append job {job.id}")
-            with job_queue_lock:
-                print(f"[safe_append_job] Lock acquired, appending job {job.id} to queue")
-                job_queue.append((job, memo_to_sign))
-        else:
-            job_queue.append((job, memo_to_sign))
-
-    def safe_pop_job():
-        if use_thread_lock:
-            print(f"[safe_pop_job] Acquiring lock to pop job")
-            with job_queue_lock:
-                if job_queue:
-                    job, memo_to_sign = job_queue.popleft()
-                    print(f"[safe_pop_job] Lock acquired, popped job {job.id}")
-                    return job, memo_to_sign
-                else:
-                    print("[safe_pop_job] Queue is empty after acquiring lock")
-        else:
-            if job_queue:
-                job, memo_to_sign = job_queue.popleft()
-                print(f"[safe_pop_job] Popped job {job.id} without lock")
-                return job, memo_to_sign
-            else:
-                print("[safe_pop_job] Queue is empty (no lock)")
-        return None, None
-
-    def job_worker():
+    def job_worker(jobs: queue.Queue):
         while True:
-            job_event.wait()
-            while True:
-                job, memo_to_sign = safe_pop_job()
-                if not job:
-                    break
-                # Process each job in its own thread to avoid blocking
-                threading.Thread(target=handle_job_with_delay, args=(job, memo_to_sign), daemon=True).start()
-            if use_thread_lock:
-                with job_queue_lock:
-                    if not job_queue:
-                        job_event.clear()
-            else:
-                if not job_queue:
-                    job_event.clear()
-
-    def handle_job_with_delay(job, memo_to_sign):
-        try:
-            process_job(job, memo_to_sign)
-            time.sleep(2)
-        except Exception as e:
-            print(f"\u274c Error processing job: {e}")
+            _, _, enqueued_at, job, memo_to_sign = jobs.get()
+            metrics.on_dequeue(time.monotonic() - enqueued_at)
+            ok = True
+            try:
+                process_job(job, memo_to_sign)
+            except Exception as e:
+                ok = False
+                print(f"\u274c Error processing job: {e}")
+            finally:
+                metrics.on_done(ok)
+                jobs.task_done()
+
+    def metrics_reporter():
+        while True:
+            time.sleep(SELLER_METRICS_INTERVAL)
+            print(f"[metrics] {json.dumps(metrics.snapshot(job_queue.qsize() + delivery_queue.qsize()))}")
 
     def on_new_task(job: ACPJob, memo_to_sign: Optional[ACPMemo] = None):
         print(f"[on_new_task] Received job {job.id} (phase: {job.phase})")
-        safe_append_job(job, memo_to_sign)
-        job_event.set()
+        jobs = delivery_queue if job.phase == ACPJobPhase.TRANSACTION else job_queue
+        priority = PHASE_PRIORITY.get(job.phase, 1)
+        try:
+            jobs.put_nowait((priority, next(job_sequence), time.monotonic(), job, memo_to_sign))
+        except queue.Full:
+            metrics.on_drop()
+            print(f"\u26a0\ufe0f Queue full, dropping job {job.id} (phase: {job.phase})")
+            if job.phase == ACPJobPhase.REQUEST:
+                try:
+                    job.respond(False, reason="Seller is at capacity, try again later")
+                except Exception as e:
+                    print(f"\u274c Error declining job {job.id}: {e}")
+            return
+        metrics.on_enqueue(job_queue.qsize() + delivery_queue.qsize())
 
     def process_job(job: ACPJob, memo_to_sign: Optional[ACPMemo] = None):
         if (
@@ -120,11 +227,11 @@ def seller(use_thread_lock: bool = True):
         ):
             print(f"Delivering job {job.id}")
             print(f"job memo: {job.dict}" )
-            mog_url = asyncio.run(call_mog(
+            mog_url = mog_client.call_mog(
                 s3_image_url=job.service_requirement['imageUrl'],
                 prompt=job.service_requirement['prompt'],
                 unique_key=job.service_requirement['unique_key'],
-            ))
+            )
             # code to call ai models here
             deliverable = IDeliverable(
                 type="url",
@@ -136,7 +243,11 @@ def seller(use_thread_lock: bool = True):
         elif job.phase == ACPJobPhase.REJECTED:
             print("Job rejected", job)
 
-    threading.Thread(target=job_worker, daemon=True).start()
+    for _ in range(SELLER_WORKERS):
+        threading.Thread(target=job_worker, args=(job_queue,), daemon=True).start()
+    for _ in range(SELLER_MAX_INFLIGHT_MOG):
+        threading.Thread(target=job_worker, args=(delivery_queue,), daemon=True).start()
+    threading.Thread(target=metrics_reporter, daemon=True).start()
 
     # Initialize the ACP client
     VirtualsACP(
@@ -151,5 +262,4 @@ def seller(use_thread_lock: bool = True):
 
 
 if __name__ == "__main__":
-    seller()
-    # asyncio.run(call_mog())
\ No newline at end of file
+    seller()
\ No newline at end of file
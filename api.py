@@ -1,103 +1,185 @@
-from typing import Union, Annotated
-from fastapi import FastAPI, UploadFile, File, Form, Request
-from fastapi.responses import FileResponse
+import time
+_import_started = time.perf_counter()
+
+from typing import Union, Annotated, List, NamedTuple
+from contextlib import asynccontextmanager, aclosing
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import FastAPI, UploadFile, File, Form, Request, Response
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
 
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
+from cachetools import TTLCache
+import asyncio
+import hashlib
+import io
+import json
+import logging
 import shutil
 import os
+import uuid
+import numpy as np
 import jawline_math as jm
+import pipeline
 # Temporarily commenting out these imports for testing
 # from acp import buyer
 from utils import s3Helper
+from utils import resultCache
+from utils import metrics
+from utils import artifactStore, imagePrep, landmarkStore, singleFlight, uploadStream
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from gemini_evaluator import scheduler
+from gemini_evaluator.evaluator import (
+    analyze_facial_features_async, get_model, IncompleteAnalysis, MODEL_NAME, PROMPT_VERSION
+)
+
+# DEBUG adds per-request progress lines and raw Gemini replies
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+# Subsystems loaded before the server takes traffic (facemesh, gemini, s3);
+# anything left out is loaded by the first request that needs it
+STARTUP_WARM_UP = {
+    name.strip() for name in os.getenv("STARTUP_WARM_UP", "facemesh,gemini,s3").split(",") if name.strip()
+}
+
+
+async def _warm_up(name: str, func):
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(func)
+    except Exception:
+        # Not fatal: the first request retries and reports the error itself
+        logger.exception("Warming up %s failed", name)
+    else:
+        logger.info("Warmed up %s in %.2fs", name, time.perf_counter() - started)
+
+
+async def startup(warm_up=STARTUP_WARM_UP):
+    """Start the worker pool and pre-warm the chosen subsystems concurrently."""
+    started = time.perf_counter()
+    steps = [asyncio.to_thread(pipeline.start, warm_up="facemesh" in warm_up)]
+    if "gemini" in warm_up:
+        steps.append(_warm_up("gemini", get_model))
+    if "s3" in warm_up:
+        steps.append(_warm_up("s3", async_s3.warm_up))
+    # Not optional: scanning the local stores otherwise lands on the first request
+    steps.append(_warm_up("artifacts", artifacts.load))
+    steps.append(_warm_up("result cache", result_cache.load))
+    await asyncio.gather(*steps)
+
+    elapsed = time.perf_counter() - started
+    metrics.STARTUP_SECONDS.labels("startup").set(elapsed)
+    logger.info("Startup took %.2fs (warmed up: %s)", elapsed, ", ".join(sorted(warm_up)) or "nothing")
+
 
-from gemini_evaluator.evaluator import analyze_facial_features
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    yield
+    pipeline.shutdown()
+    async_s3.close()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 shape_list = ["Round", "Long"]
 
-# Temporarily commented out for testing
-s3Helper = s3Helper.s3Helper()
+async_s3 = s3Helper.asyncS3Helper()
+result_cache = resultCache.ResultCache()
+# Local copies of uploaded images ("uploads") and guidance text ("evaluation"), read before S3
+artifacts = artifactStore.ArtifactStore()
+# Redelivered or retried jobs join the run already in flight for their unique_key,
+# and a photo already being analyzed under another key is waited for, not redone
+mog_flights = singleFlight.SingleFlight()
+image_flights: "dict[str, asyncio.Future]" = {}
 
-# Simple File Upload logic from user (Change to fit ACP)
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Loaded once; rendering /evaluation pages no longer touches the filesystem
+templates = Jinja2Templates(directory="templates")
+
+# Rendered /evaluation pages embed a presigned mesh url, so they must expire well before it does
+EVALUATION_URL_EXPIRY = 180000
+EVALUATION_CACHE_TTL = min(int(os.getenv("EVALUATION_CACHE_TTL", 3600)), EVALUATION_URL_EXPIRY // 2)
+evaluation_pages = TTLCache(maxsize=int(os.getenv("EVALUATION_CACHE_SIZE", 1024)), ttl=EVALUATION_CACHE_TTL)
+
+metrics.STARTUP_SECONDS.labels("import").set(time.perf_counter() - _import_started)
 
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
 
+@app.get("/metrics")
+def prometheus_metrics():
+    """Stage latency histograms and pipeline counters in Prometheus text format."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+class EvaluationPage(NamedTuple):
+    html: bytes
+    etag: str
+    last_modified: float
+
+
+def _render_evaluation(guidance: str, mesh_url: str) -> EvaluationPage:
+    html = templates.get_template("index.html").render(
+        page_title="Sigma boi",
+        heading="Your Image & Analysis",
+        image_src=mesh_url,
+        image_alt="User submission",
+        caption=f"Uploaded locally from {mesh_url}",
+        text_content=guidance,
+        is_html=True,  # set True if you pass HTML in text_content
+    ).encode("utf-8")
+    etag = '"' + hashlib.sha256(html).hexdigest()[:32] + '"'
+    return EvaluationPage(html, etag, time.time())
+
+
+def _is_not_modified(request: Request, page: EvaluationPage) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return page.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(page.last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
 @app.get("/evaluation/{key}")
-def evaluation(request: Request, key: str):
-    # generate presigned image from s3
-    mesh_path = f"mesh-{key}"
-    mesh_url = s3Helper.generate_presigned_url(mesh_path)
-    
-    # Download text
-    guidance_path = f"guidance-{key}.txt"
-    evaluation_path_text = f"evaluation/{guidance_path}.txt"
-    
-    s3Helper.download(guidance_path, evaluation_path_text)
-
-    with open(evaluation_path_text, 'r') as file:
-        content = file.read()
-
-    templates = Jinja2Templates(directory="templates")
-
-    DOCS_DIR = Path("evaluation").resolve()  # put your .txt files here
-
-    path = (DOCS_DIR /f"{guidance_path}.txt").resolve()
-    guidance = path.read_text(encoding="utf-8")
-    
-
-        
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "page_title": "Sigma boi",
-            "heading": "Your Image & Analysis",
-            "image_src": mesh_url, 
-            "image_alt": "User submission",
-            "caption": f"Uploaded locally from {mesh_url}",
-            "text_content": guidance,
-            "is_html": True,  # set True if you pass HTML in text_content
-        }
+async def evaluation(request: Request, key: str):
+    page = evaluation_pages.get(key)
+    if page is None:
+        # Read the guidance text straight into memory; the mesh url is signed locally
+        guidance_path = f"guidance-{key}.txt"
+        guidance = (await _read_through("evaluation", guidance_path)).decode("utf-8")
+        mesh_url = await async_s3.presign(f"mesh-{key}", expires_in=EVALUATION_URL_EXPIRY)
+        page = evaluation_pages[key] = _render_evaluation(guidance, mesh_url)
+
+    headers = {
+        "ETag": page.etag,
+        "Last-Modified": formatdate(page.last_modified, usegmt=True),
+        # Let browsers keep the page but revalidate, which is a cheap 304
+        "Cache-Control": "private, no-cache",
+    }
+    if _is_not_modified(request, page):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(page.html, headers=headers)
+
+
+def assess_jawline(jawline_shape: str) -> str:
+    return (
+        "⚠️ Your jawline could be enhanced with regular exercises."
+        if jawline_shape in shape_list
+        else "🎯 Your jawline appears naturally well-defined based on facial proportions!"
     )
 
 
-@app.get("/mog")
-async def mog(image: str, prompt: str, unique_key: str) -> dict:
-    try:
-        print(f"Processing request for image: {image}")
-        # First process the image with your existing jawline detection
-        uploaded_file = s3Helper.download(unique_key, f"{UPLOAD_FOLDER}/{unique_key}.png")
-        if not os.path.exists(uploaded_file):
-            print(f"Image not found: {uploaded_file}")
-            return {"error": f"Image {image} not found"}
-        
-        print("Processing image with jawline detection...")
-        # Process image with existing jawline detection
-        img = Image.open(uploaded_file)
-        output_image, landmarks = jm.draw_face_landmarks(img)
-        
-        if output_image is not None and landmarks:
-            print("Landmarks detected, analyzing jawline...")
-            # Get jawline analysis from your existing code
-            jawline_shape = jm.classify_face_shape(landmarks, img.size[::-1])
-            jawline_assessment = (
-                "⚠️ Your jawline could be enhanced with regular exercises."
-                if jawline_shape in shape_list
-                else "🎯 Your jawline appears naturally well-defined based on facial proportions!"
-            )
-            
-            print("Getting Gemini analysis...")
-            # Get Gemini's analysis for other facial features
-            other_features = analyze_facial_features(uploaded_file)
-            
-            # Format the response in a readable way
-            readable_response = f"""� SIGMA MALE FACIAL ANALYSIS REPORT 💪
+def format_report(jawline_shape: str, other_features: dict) -> str:
+    """Render the guidance text from the face shape and Gemini's analysis."""
+    jawline_assessment = assess_jawline(jawline_shape)
+
+    return f"""� SIGMA MALE FACIAL ANALYSIS REPORT 💪
 
 🗿 JAWLINE ASSESSMENT (MOST IMPORTANT):
 • Current Shape: {jawline_shape}
@@ -151,56 +233,337 @@ async def mog(image: str, prompt: str, unique_key: str) -> dict:
 • How to Become Gigachad:
   - {other_features['facial_harmony']['enhancement_suggestions'][0]}
   - {other_features['facial_harmony']['enhancement_suggestions'][1]}"""
-            
-            print("Analysis complete!")
-            mesh_image = Image.fromarray(output_image)
-            mesh_path = f"mesh/{unique_key}.png"
-            mesh_image.save(mesh_path)
-            mesh_key = f"mesh-{unique_key}"
-            mesh_url = s3Helper.upload(image_path=mesh_path, key=mesh_key)
-
-            # Save text
-            guidance_path = f"guidance/guidance-{unique_key}.txt"
-            with open(guidance_path, "w") as file:
-              file.write(readable_response)
-            
-            s3Helper.upload_txt(filename=guidance_path, unique_key=unique_key) 
-            return {"formatted_response": readable_response, "mesh_key": mesh_key}
+
+
+async def _timed(stage: str, awaitable):
+    with metrics.timed(stage):
+        return await awaitable
+
+
+async def _store_artifact(namespace: str, key: str, data: bytes):
+    """Keep a local copy of key; the store is only a cache, so a failed write (e.g. disk full) is not fatal."""
+    try:
+        await asyncio.to_thread(artifacts.put, namespace, key, data)
+    except OSError:
+        metrics.ARTIFACT_WRITE_ERRORS.labels(namespace).inc()
+        logger.warning("Could not store local copy of %s", key, exc_info=True)
+
+
+async def _read_through(namespace: str, key: str, newer_than: float = 0.0) -> bytes:
+    """key from the local artifact store if it is fresh enough, else from S3 (keeping a local copy)."""
+    data = await asyncio.to_thread(artifacts.get, namespace, key, newer_than)
+    metrics.ARTIFACT_LOOKUPS.labels(namespace, "miss" if data is None else "hit").inc()
+    if data is None:
+        data = await async_s3.download_bytes(key)
+        await _store_artifact(namespace, key, data)
+    return data
+
+
+async def mog_events(image: str, unique_key: str, lane: str = scheduler.DEFAULT_LANE):
+    """Run the /mog pipeline, yielding (event, data) pairs as each stage completes.
+
+    Stages: downloaded, landmarks, mesh, one analysis event per Gemini section,
+    then report. Failures end the stream with an error event. lane is the
+    Gemini scheduler priority: the ACP seller sends its deliveries as "delivery".
+    """
+    if lane not in scheduler.LANES:
+        yield "error", {"error": f"Unknown lane {lane!r}; use one of {', '.join(scheduler.LANES)}"}
+        return
+    # Tasks started below that must not outlive the request if it fails
+    pending = []
+    image_flight = None
+    try:
+        logger.debug("Processing request for image: %s", image)
+        # A finished job is served from its stored guidance unless the image was re-uploaded since
+        guidance_key = f"guidance-{unique_key}.txt"
+        stored, uploaded = await _timed("s3_stored_check", asyncio.gather(
+            async_s3.head(guidance_key), async_s3.head(unique_key)
+        ))
+        if stored is not None and (uploaded is None or stored["LastModified"] > uploaded["LastModified"]):
+            metrics.MOG_COALESCED.labels("stored").inc()
+            logger.debug("Returning stored result for %s", unique_key)
+            guidance = await _timed("s3_download_guidance", _read_through(
+                "evaluation", guidance_key, stored["LastModified"].timestamp()
+            ))
+            yield "report", {"formatted_response": guidance.decode("utf-8"), "mesh_key": f"mesh-{unique_key}"}
+            return
+
+        # The image stays in memory from S3 through FaceMesh, Gemini and the uploads. A local
+        # copy only counts if it is newer than the S3 object; with no object, S3 reports the miss
+        newer_than = uploaded["LastModified"].timestamp() if uploaded is not None else float("inf")
+        try:
+            image_bytes = await _timed("s3_download", _read_through("uploads", unique_key, newer_than))
+        except async_s3.s3.exceptions.NoSuchKey:
+            logger.info("Image not found: %s", unique_key)
+            yield "error", {"error": f"Image {image} not found"}
+            return
+        yield "downloaded", {"bytes": len(image_bytes)}
+
+        cache_key = resultCache.cache_key(image_bytes, MODEL_NAME, PROMPT_VERSION)
+        cached = await asyncio.to_thread(result_cache.get, cache_key)
+        mesh_key = f"mesh-{unique_key}"
+        gemini = None
+        complete = True
+
+        metrics.RESULT_CACHE_LOOKUPS.labels("hit" if cached is not None else "miss").inc()
+        if cached is None and cache_key in image_flights:
+            metrics.MOG_COALESCED.labels("image").inc()
+            logger.debug("Waiting for the in-flight analysis of %s", cache_key[:12])
+            # None if that run failed, in which case this one tries for itself
+            cached = await asyncio.shield(image_flights[cache_key])
+        if cached is not None:
+            # Same photo seen before: skip FaceMesh and Gemini, only write this key's artifacts
+            logger.debug("Result cache hit for %s", cache_key[:12])
+            jawline_shape, landmarks = cached.face_shape, cached.landmarks
+            other_features = cached.analysis
+            mesh, mesh_content_type = cached.mesh, cached.mesh_content_type
         else:
-            print("No landmarks detected")
-            return {
-                "error": "Could not detect face landmarks",
-                "landmarks_detected": False
-            }
+            image_flight = image_flights[cache_key] = asyncio.get_running_loop().create_future()
+            # Gemini doesn't need the landmarks, so it starts as soon as the image is local
+            logger.debug("Getting Gemini analysis and landmarks...")
+            gemini = asyncio.create_task(analyze_facial_features_async(image_bytes, lane=lane))
+            pending.append(gemini)
+
+            # Landmarks, face shape and mesh rendering run on the worker pool
+            jawline_shape, landmarks, mesh, timings = await pipeline.run(
+                pipeline.detect_and_render, image_bytes
+            )
+            metrics.observe(timings)
+            if jawline_shape is None:
+                metrics.NO_FACE.inc()
+                logger.info("No landmarks detected for %s", unique_key)
+                yield "error", {
+                    "error": "Could not detect face landmarks",
+                    "landmarks_detected": False
+                }
+                return
+            mesh_content_type = jm.MESH_CONTENT_TYPES[jm.MESH_FORMAT]
+
+        # The mesh is usually ready before Gemini is, so ship it while we wait
+        mesh_upload = asyncio.create_task(_timed(
+            "s3_upload_mesh", async_s3.upload_bytes(mesh, key=mesh_key, content_type=mesh_content_type)
+        ))
+        pending.append(mesh_upload)
+        # Landmarks are kept next to the mesh so it can be re-drawn or re-scored without FaceMesh
+        image_shape = imagePrep.oriented_size(Image.open(io.BytesIO(image_bytes)))
+        landmarks_upload = asyncio.create_task(_timed("s3_upload_landmarks", async_s3.upload_bytes(
+            landmarkStore.serialize(landmarks, image_shape, jawline_shape),
+            key=landmarkStore.landmarks_key(unique_key),
+            content_type="application/octet-stream",
+        )))
+        pending.append(landmarks_upload)
+        yield "landmarks", {
+            "face_shape": jawline_shape,
+            "assessment": assess_jawline(jawline_shape),
+            "landmarks": np.round(landmarks, 5).tolist(),
+        }
+
+        # Report the mesh and the Gemini sections in whichever order they land
+        waiting = {mesh_upload} if gemini is None else {mesh_upload, gemini}
+        if gemini is None:
+            for section, analysis in other_features.items():
+                yield "analysis", {"section": section, "analysis": analysis}
+        while waiting:
+            done, waiting = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is mesh_upload:
+                    yield "mesh", {"mesh_key": mesh_key, "mesh_url": task.result()}
+                else:
+                    try:
+                        other_features = task.result()
+                    except IncompleteAnalysis as e:
+                        # Placeholders keep the report whole; they just aren't worth caching
+                        other_features, complete = e.analysis, False
+                    for section, analysis in other_features.items():
+                        yield "analysis", {"section": section, "analysis": analysis}
+
+        # Format the response in a readable way
+        readable_response = format_report(jawline_shape, other_features)
+        result = resultCache.CachedResult(jawline_shape, landmarks, other_features, mesh, mesh_content_type)
+        if image_flight is not None:
+            image_flight.set_result(result)
+
+        async def store_guidance():
+            await _timed("s3_upload_guidance", async_s3.upload_text(readable_response, unique_key=unique_key))
+            # Kept locally only once S3 has it, so the copy counts as newer than the object
+            await _store_artifact("evaluation", guidance_key, readable_response.encode("utf-8"))
+
+        uploads = [store_guidance(), landmarks_upload]
+        if cached is None and complete:
+            # Only cache complete analyses, so a bad Gemini reply is retried next time
+            uploads.append(asyncio.to_thread(result_cache.put, cache_key, result))
+        await asyncio.gather(*uploads)
+        # A re-run replaces the guidance, so drop any page rendered from the old one
+        evaluation_pages.pop(unique_key, None)
+
+        logger.debug("Analysis complete for %s", unique_key)
+        yield "report", {"formatted_response": readable_response, "mesh_key": mesh_key}
     except Exception as e:
-        print(f"Error in /mog endpoint: {str(e)}")
-        return {
+        logger.exception("Error in /mog endpoint")
+        yield "error", {
             "error": "Internal server error",
             "details": str(e)
         }
+    finally:
+        for task in pending:
+            task.cancel()
+        if image_flight is not None:
+            image_flights.pop(cache_key, None)
+            if not image_flight.done():
+                image_flight.set_result(None)
+
+
+def _follow_mog(image: str, unique_key: str, lane: str):
+    """mog_events for unique_key, joining the run already in flight for it if there is one."""
+    if unique_key in mog_flights:
+        metrics.MOG_COALESCED.labels("key").inc()
+        logger.debug("Joining the in-flight run for %s", unique_key)
+    return mog_flights.follow(unique_key, lambda: mog_events(image, unique_key, lane))
+
+
+@app.get("/mog")
+async def mog(image: str, prompt: str, unique_key: str, lane: str = scheduler.DEFAULT_LANE) -> dict:
+    async with aclosing(_follow_mog(image, unique_key, lane)) as events:
+        async for event, data in events:
+            if event in ("report", "error"):
+                return data
+
+
+@app.get("/mog/stream")
+async def mog_stream(image: str, prompt: str, unique_key: str, lane: str = scheduler.DEFAULT_LANE):
+    """Server-sent events version of /mog that pushes each stage as it completes."""
+    async def stream():
+        async with aclosing(_follow_mog(image, unique_key, lane)) as events:
+            async for event, data in events:
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Largest video (or total of all frames) /mog/video will read
+VIDEO_MAX_BYTES = int(os.getenv("VIDEO_MAX_BYTES", 50 * 1024 * 1024))
+
+
+@app.post("/mog/video")
+async def mog_video(
+        unique_key: Annotated[str, Form()],
+        video: Union[UploadFile, None] = None,
+        frames: Annotated[Union[List[UploadFile], None], File()] = None,
+    ) -> dict:
+    """Face shape from a short video or a stream of frames, using FaceMesh tracking.
+
+    Returns the shape most frames agreed on (after smoothing the jaw ratios) and
+    mesh overlays for a few sampled frames, uploaded as mesh-{key}-{frame}.
+    """
+    if video is None and not frames:
+        return {"error": "Send a video or one or more frames"}
+    try:
+        if video is not None:
+            source = await video.read(VIDEO_MAX_BYTES + 1)
+            size = len(source)
+        else:
+            source = [await frame.read(VIDEO_MAX_BYTES + 1) for frame in frames]
+            size = sum(len(data) for data in source)
+        if size > VIDEO_MAX_BYTES:
+            return {"error": f"Upload is larger than {VIDEO_MAX_BYTES} bytes"}
+
+        summary, meshes, timings = await pipeline.run(pipeline.track_video, source)
+        metrics.observe(timings)
+        if summary["face_shape"] is None:
+            metrics.NO_FACE.inc()
+            return {**summary, "error": "Could not detect face landmarks", "landmarks_detected": False}
+
+        mesh_content_type = jm.MESH_CONTENT_TYPES[jm.MESH_FORMAT]
+        mesh_keys = [f"mesh-{unique_key}-{index}" for index, _ in meshes]
+        with metrics.timed("s3_upload_mesh"):
+            mesh_urls = await async_s3.upload_many(
+                [(mesh, key, mesh_content_type) for (_, mesh), key in zip(meshes, mesh_keys)]
+            )
+        return {
+            **summary,
+            "assessment": assess_jawline(summary["face_shape"]),
+            "mesh_frames": [
+                {"frame": index, "mesh_key": key, "mesh_url": url}
+                for (index, _), key, url in zip(meshes, mesh_keys, mesh_urls)
+            ],
+        }
+    except (ValueError, UnidentifiedImageError) as e:
+        # Undecodable video or frame
+        return {"error": str(e)}
+    except Exception as e:
+        logger.exception("Error in /mog/video endpoint")
+        return {"error": "Internal server error", "details": str(e)}
+
+
+# Multipart boundaries and the key/prompt fields on top of the image itself
+UPLOAD_FORM_OVERHEAD = 2 * uploadStream.UPLOAD_MAX_FIELD_BYTES + 4096
+
+
+def _upload_error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse({"error": True, "error messsage": message}, status_code=status_code)
 
 
 @app.post("/upload")
-async def upload(
-        image: UploadFile, 
-        key: Annotated[str, Form()], 
-        prompt: Annotated[str, Form()]
-    ) -> dict: 
-    
-    if not image or not image.filename: 
-        return "Please send file"
-    try: 
-        s3_image_url = s3Helper.upload(image.filename, key, prompt)
-        print(s3_image_url)
+async def upload(request: Request):
+    """Stream the `image` form file straight into S3 under the `key` form field.
+
+    The body is parsed as it arrives: the image header is checked from the first
+    bytes and the size cap as it streams, so bad uploads are refused without
+    reading the rest, and nothing is spooled to disk or held whole in memory.
+    If the image arrives before `key`, it is staged and moved once `key` is known.
+    """
+    declared = int(request.headers.get("content-length") or 0)
+    if declared > uploadStream.UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD:
+        metrics.UPLOADS_REJECTED.labels("too_large").inc()
+        return _upload_error(413, f"Image is larger than {uploadStream.UPLOAD_MAX_BYTES} bytes")
+
+    fields = {}
+    staged = None
+    uploaded = None
+    try:
+        form = uploadStream.iter_form(request)
+        async for event in form:
+            if event[0] == "field":
+                fields[event[1]] = event[2]
+            elif event[0] == "file" and event[1] == "image" and uploaded is None:
+                stream = uploadStream.ImageStream(form)
+                await stream.sniff()
+                if "key" in fields:
+                    target = fields["key"]
+                else:
+                    target = staged = f"incoming/{uuid.uuid4().hex}"
+                with metrics.timed("s3_upload_image"):
+                    url = await async_s3.upload_stream(
+                        stream, target, content_type=stream.content_type, prompt=fields.get("prompt")
+                    )
+                uploaded = stream
+
+        if uploaded is None:
+            return _upload_error(400, "Please send file")
+        if not fields.get("key"):
+            raise uploadStream.UploadRejected(400, "bad_form", "Missing key")
+        if staged is not None:
+            url = await async_s3.move(staged, fields["key"], uploaded.content_type, prompt=fields.get("prompt"))
+            staged = None
+    except uploadStream.UploadRejected as e:
+        metrics.UPLOADS_REJECTED.labels(e.reason).inc()
+        return _upload_error(e.status_code, e.message)
     except Exception as e:
-        print(e)
-        response_error: dict = {
-            "error": True, "error messsage": e
-        }
-        return response_error
-    else: 
-        response_successful: dict = {
-            "error": False, "image_url": s3_image_url 
-        }
-        return response_successful
+        logger.exception("Error in /upload endpoint")
+        return _upload_error(500, str(e))
+    finally:
+        if staged is not None and uploaded is not None:
+            await async_s3.delete(staged)
 
+    # Streamed straight to S3, so any local copy of an earlier image under this key is stale
+    # (/mog would skip it anyway, since it is older than the S3 object)
+    try:
+        await asyncio.to_thread(artifacts.delete, "uploads", fields["key"])
+    except OSError:
+        logger.warning("Could not drop local copy of %s", fields["key"], exc_info=True)
+    logger.debug("Uploaded %s (%s, %d bytes)", fields["key"], uploaded.format, uploaded.size)
+    return {"error": False, "image_url": url}
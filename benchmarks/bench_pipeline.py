@@ -0,0 +1,325 @@
+"""
+Offline benchmarks for the analysis pipeline.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_pipeline --iterations 30 --out bench.json
+
+Gemini and S3 are replaced by local stand-ins (Gemini with a configurable
+latency), so no network access or secrets are needed. Results are printed as
+JSON (ops/s, p50/p95/p99 latency in ms, peak RSS) so runs on different commits
+can be diffed; use --out to get the report without the server's log lines.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image
+
+import api
+import jawline_math as jm
+import pipeline
+from gemini_evaluator import evaluator
+
+SAMPLE_IMAGES = ["Caleb.png", "SleepyJoe.png"]
+SYNTHETIC_EDGES = [1080, 2160, 4032]
+
+FAKE_ANALYSIS = {
+    "jawline_enhancement": {
+        "current_definition": "Razor-adjacent",
+        "definition_score": 7,
+        "mewing_tips": ["Tongue on roof", "Never stop"],
+        "sigma_grindset": ["Wake at 4am", "Cold showers"],
+        "gigachad_quotes": ["Mog or be mogged", "Stay hard"],
+    },
+    "eyes_and_eyebrows": {"description": "Hunter-ish", "sigma_score": 6, "suggestions": ["Squint", "Sleep"]},
+    "nose_structure": {"description": "Roman", "mog_score": 8, "suggestions": ["Nothing", "Nothing"]},
+    "cheekbones": {"description": "High", "bone_score": 7, "suggestions": ["Lean out", "Chew gum"]},
+    "skin_quality": {"description": "Clear", "zyzz_score": 7, "care_recommendations": ["SPF", "Water"]},
+    "facial_harmony": {"balance_description": "Balanced", "mogger_score": 7, "enhancement_suggestions": ["Lift", "Sleep"]},
+}
+
+
+# ---------------------- Local stand-ins -------------------------
+
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+        self.candidates = []
+
+
+class FakeGemini:
+    """Replaces genai.GenerativeModel; answers after a fixed latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.text = json.dumps(FAKE_ANALYSIS)
+
+    async def generate_content_async(self, contents):
+        await asyncio.sleep(self.latency)
+        return FakeGeminiResponse(self.text)
+
+
+class LocalS3:
+    """In-memory stand-in for utils.s3Helper.asyncS3Helper."""
+
+    class s3:
+        class exceptions:
+            class NoSuchKey(Exception):
+                pass
+
+    def __init__(self):
+        self.objects = {}
+        self.modified = {}
+
+    async def head(self, key: str):
+        modified = datetime.fromtimestamp(self.modified.get(key, 0.0), timezone.utc)
+        return {"LastModified": modified} if key in self.objects else None
+
+    async def download_bytes(self, key: str) -> bytes:
+        try:
+            return self.objects[key]
+        except KeyError:
+            raise self.s3.exceptions.NoSuchKey(key) from None
+
+    async def upload_bytes(self, data: bytes, key: str, content_type: str = "image/png",
+                           prompt: str = None, advice: str = None) -> str:
+        self.objects[key] = bytes(data)
+        self.modified[key] = time.time()
+        return self.generate_presigned_url(key)
+
+    async def upload_text(self, text: str, unique_key: str) -> str:
+        return await self.upload_bytes(text.encode("utf-8"), f"guidance-{unique_key}.txt")
+
+    async def upload_many(self, objects) -> list:
+        return [await self.upload_bytes(data, key, content_type) for data, key, content_type in objects]
+
+    def generate_presigned_url(self, key: str, expires_in: int = 0) -> str:
+        return f"local://{key}"
+
+    def close(self):
+        pass
+
+
+class NoCache:
+    """Result cache that never hits, so /mog runs the full pipeline every time."""
+
+    def load(self):
+        pass
+
+    def get(self, key):
+        return None
+
+    def put(self, key, result):
+        pass
+
+
+# ---------------------- Measurement -------------------------
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(name: str, latencies, wall: float, **extra) -> dict:
+    ms = np.asarray(latencies) * 1000
+    return {
+        "name": name,
+        "iterations": len(latencies),
+        "ops_per_s": round(len(latencies) / wall, 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        # Process-wide high-water mark, so it only grows across benchmarks
+        "peak_rss_mb": peak_rss_mb(),
+        **extra,
+    }
+
+
+def bench(name: str, func, iterations: int, warmup: int = 2, **extra) -> dict:
+    for _ in range(warmup):
+        func()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(name, latencies, time.perf_counter() - start, **extra)
+
+
+async def bench_async(name: str, make_call, iterations: int, concurrency: int, **extra) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            t0 = time.perf_counter()
+            await make_call(i)
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(iterations)])
+    return summarize(name, latencies, time.perf_counter() - start, concurrency=concurrency, **extra)
+
+
+# ---------------------- Inputs -------------------------
+
+def load_images() -> dict:
+    """Bundled samples plus the first sample upscaled to common phone resolutions."""
+    images = {name: Image.open(name).convert("RGB") for name in SAMPLE_IMAGES}
+    base = images[SAMPLE_IMAGES[0]]
+    for edge in SYNTHETIC_EDGES:
+        scale = edge / max(base.size)
+        images[f"synthetic-{edge}"] = base.resize((round(base.width * scale), round(base.height * scale)))
+    return images
+
+
+def encode_png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# ---------------------- Benchmarks -------------------------
+
+def run_cpu_benchmarks(images: dict, iterations: int) -> list:
+    results = []
+    pool = jm.FaceMeshPool(size=1)
+    pool.warm_up()
+
+    landmarks = {}
+    for name, image in images.items():
+        output_image, points = jm.draw_face_landmarks(image, pool=pool)
+        landmarks[name] = (output_image, points)
+        results.append(bench(
+            f"draw_face_landmarks[{name}]",
+            lambda image=image: jm.draw_face_landmarks(image, pool=pool),
+            iterations,
+            size=list(image.size),
+        ))
+
+    # Tracking mode: once a face is found, frames only refine the previous landmarks
+    with jm.FaceTracker() as tracker:
+        for name in (SAMPLE_IMAGES[0], f"synthetic-{SYNTHETIC_EDGES[1]}"):
+            frame = np.array(images[name])
+            tracker.process(frame)
+            results.append(bench(f"FaceTracker.process[{name}]", lambda: tracker.process(frame), iterations))
+
+    output_image, points = landmarks[SAMPLE_IMAGES[0]]
+    image_shape = output_image.shape[:2]
+    results.append(bench("classify_face_shape", lambda: jm.classify_face_shape(points, image_shape), iterations * 100))
+    batch = np.repeat(points[np.newaxis], 1000, axis=0)
+    results.append(bench(
+        "classify_face_shapes[batch=1000]", lambda: jm.classify_face_shapes(batch, image_shape), iterations
+    ))
+
+    for name in (SAMPLE_IMAGES[0], f"synthetic-{SYNTHETIC_EDGES[1]}"):
+        base = np.array(images[name])
+        points = landmarks[name][1]
+        results.append(bench(f"render_mesh[{name}]", lambda: jm.render_mesh(base.copy(), points), iterations))
+        for fmt in jm.MESH_CONTENT_TYPES:
+            encoded = jm.encode_mesh(base, fmt=fmt)
+            results.append(bench(
+                f"encode_mesh[{name},{fmt}]", lambda fmt=fmt: jm.encode_mesh(base, fmt=fmt), iterations,
+                bytes=len(encoded),
+            ))
+
+    text = json.dumps(FAKE_ANALYSIS)
+    wrapped = f"Sure! Here is your analysis:\n```json\n{text}\n```\nStay sigma."
+    results.append(bench("_extract_json[direct]", lambda: evaluator._extract_json(text), iterations * 100))
+    results.append(bench("_extract_json[fallback]", lambda: evaluator._extract_json(wrapped), iterations * 100))
+
+    pool.close()
+    return results
+
+
+async def run_mog_benchmarks(images: dict, iterations: int, gemini_latency: float,
+                             concurrency: int, workers: int) -> list:
+    results = []
+    s3 = LocalS3()
+    api.async_s3 = s3
+    # Still pays for writing local copies, but evicts them so every download goes to S3
+    api.artifacts = api.artifactStore.ArtifactStore(tempfile.mkdtemp(), max_bytes=0)
+    evaluator._model = FakeGemini(gemini_latency)
+    pipeline.start(workers)
+    try:
+        for name in (SAMPLE_IMAGES[0], f"synthetic-{SYNTHETIC_EDGES[1]}"):
+            image_bytes = encode_png(images[name])
+            for i in range(iterations):
+                s3.objects[f"{name}-{i}"] = image_bytes
+
+            async def call(i, name=name):
+                result = await api.mog(image=name, prompt="bench", unique_key=f"{name}-{i}")
+                if "error" in result:
+                    raise RuntimeError(result)
+                # Otherwise the next call for this key is answered from the stored guidance
+                del s3.objects[f"guidance-{name}-{i}.txt"]
+
+            api.result_cache = NoCache()
+            await call(0)  # warm up the workers
+            for level in sorted({1, concurrency}):
+                results.append(await bench_async(
+                    f"mog[{name},miss]", call, iterations, level,
+                    gemini_latency_s=gemini_latency, workers=workers,
+                ))
+
+            api.result_cache = api.resultCache.ResultCache(directory=os.path.join("cache", "bench"))
+            await call(0)  # populate the cache
+            results.append(await bench_async(f"mog[{name},hit]", call, iterations, concurrency, workers=workers))
+    finally:
+        pipeline.shutdown()
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="fake Gemini latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent /mog requests")
+    parser.add_argument("--workers", type=int, default=pipeline.MOG_WORKERS, help="MOG_WORKERS for the run")
+    parser.add_argument("--skip-mog", action="store_true", help="only run the CPU-bound benchmarks")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    images = load_images()
+    results = run_cpu_benchmarks(images, args.iterations)
+    if not args.skip_mog:
+        results += asyncio.run(run_mog_benchmarks(
+            images, args.iterations, args.gemini_latency, args.concurrency, args.workers
+        ))
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, "w") as file:
+            file.write(output)
+
+
+if __name__ == "__main__":
+    main()
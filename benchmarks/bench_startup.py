@@ -0,0 +1,148 @@
+"""
+Cold start benchmark: import time, startup hook time and time to first /mog.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_startup --repeats 3 --out startup.json
+
+Each sample is a fresh interpreter, once per STARTUP_WARM_UP setting, so the
+numbers show where eager warm-up moves cost from the first request to startup.
+S3 is a local moto server (pip install "moto[server]") so the real boto3 client
+is built and used; Gemini is configured with a dummy key and answered by the
+fake from bench_pipeline, so no network access or secrets are needed.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+WARM_UP_MODES = ["facemesh,gemini,s3", ""]
+IMAGE = "Caleb.png"
+KEYS = ("startup-1", "startup-2")
+
+
+def child(gemini_latency: float):
+    started = time.perf_counter()
+    import api
+    imported = time.perf_counter()
+
+    import asyncio
+    from benchmarks.bench_pipeline import FakeGemini, NoCache
+    from gemini_evaluator import evaluator
+
+    # Still import and configure google.generativeai on first use, then answer offline
+    fake = FakeGemini(gemini_latency)
+    evaluator.get_model = lambda: (evaluator.configure(), fake)[1]
+    api.result_cache = NoCache()
+
+    async def run():
+        timings = {"import_s": imported - started}
+        t0 = time.perf_counter()
+        await api.startup(api.STARTUP_WARM_UP)
+        timings["startup_s"] = time.perf_counter() - t0
+        for label, key in zip(("first_request_s", "second_request_s"), KEYS):
+            t0 = time.perf_counter()
+            result = await api.mog(image=IMAGE, prompt="bench", unique_key=key)
+            if "error" in result:
+                raise RuntimeError(result)
+            timings[label] = time.perf_counter() - t0
+        timings["time_to_first_response_s"] = timings["import_s"] + timings["startup_s"] + timings["first_request_s"]
+        return timings
+
+    try:
+        timings = asyncio.run(run())
+    finally:
+        api.pipeline.shutdown()
+        api.async_s3.close()
+    print(json.dumps({name: round(value, 3) for name, value in timings.items()}))
+
+
+def start_s3(env: dict):
+    """Start a moto S3 server holding the sample image under the keys the child requests."""
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        sys.exit('bench_startup needs a local S3: pip install "moto[server]"')
+    import boto3
+
+    server = ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    env.update(
+        S3_ENDPOINT_URL=f"http://{host}:{port}",
+        AWS_ACCESS_KEY_ID="bench",
+        AWS_SECRET_ACCESS_KEY="bench",
+    )
+    from utils.s3Helper import s3Helper
+    client = boto3.client(
+        "s3", region_name="ap-southeast-1", endpoint_url=env["S3_ENDPOINT_URL"],
+        aws_access_key_id="bench", aws_secret_access_key="bench",
+    )
+    client.create_bucket(
+        Bucket=s3Helper.BUCKET_NAME, CreateBucketConfiguration={"LocationConstraint": "ap-southeast-1"}
+    )
+    with open(IMAGE, "rb") as file:
+        data = file.read()
+    for key in KEYS:
+        client.put_object(Bucket=s3Helper.BUCKET_NAME, Key=key, Body=data)
+    return server, client
+
+
+def clear_results(client):
+    """Drop the guidance a run stored, so the next run analyzes the images instead of returning it."""
+    from utils.s3Helper import s3Helper
+    for key in KEYS:
+        client.delete_object(Bucket=s3Helper.BUCKET_NAME, Key=f"guidance-{key}.txt")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=0, help="MOG_WORKERS for the run")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="fake Gemini latency in seconds")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.gemini_latency)
+        return
+
+    env = dict(os.environ, GEMINI_API_KEY="offline-benchmark", MOG_WORKERS=str(args.workers), LOG_LEVEL="WARNING")
+    server, client = start_s3(env)
+    results = []
+    try:
+        for mode in WARM_UP_MODES:
+            samples = []
+            for _ in range(args.repeats):
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_startup", "--child",
+                     "--gemini-latency", str(args.gemini_latency)],
+                    # A fresh local artifact store each time, so the first request really goes to S3
+                    env=dict(env, STARTUP_WARM_UP=mode, ARTIFACT_DIR=tempfile.mkdtemp()),
+                    capture_output=True, text=True, check=True,
+                ).stdout
+                samples.append(json.loads(output.strip().splitlines()[-1]))
+                clear_results(client)
+            results.append({
+                "warm_up": mode or "none",
+                "workers": args.workers,
+                # Median of the repeats for each measurement
+                **{name: sorted(s[name] for s in samples)[len(samples) // 2] for name in samples[0]},
+            })
+    finally:
+        server.stop()
+
+    output = json.dumps({"python": sys.version.split()[0], "repeats": args.repeats, "results": results}, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, "w") as file:
+            file.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import asyncio
+import itertools
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from utils import s3Helper
+from utils.artifactStore import ArtifactStore
+
+
+@pytest.fixture(scope="session")
+def s3():
+    """A boto3 client for a local moto server with the app's bucket, shared by the whole run.
+
+    moto keeps one backend per process, so every server would see the same bucket
+    anyway; tests keep apart by writing under their own prefix.
+    """
+    moto_server = pytest.importorskip("moto.server")
+    import boto3
+    from botocore.client import Config
+
+    server = moto_server.ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    client = boto3.client(
+        "s3",
+        region_name="ap-southeast-1",
+        endpoint_url=f"http://{host}:{port}",
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+        config=Config(signature_version="v4"),
+    )
+    client.create_bucket(
+        Bucket=s3Helper.asyncS3Helper.BUCKET_NAME,
+        CreateBucketConfiguration={"LocationConstraint": "ap-southeast-1"},
+    )
+    yield client
+    server.stop()
+
+
+@pytest.fixture
+def prefix():
+    """A key prefix of this test's own in the shared bucket."""
+    return f"test-{uuid.uuid4().hex[:12]}/"
+
+
+class FakeS3:
+    """Just enough of asyncS3Helper for /mog; LastModified strictly increases with every write."""
+
+    class s3:
+        class exceptions:
+            class NoSuchKey(Exception):
+                pass
+
+    def __init__(self):
+        self.objects = {}
+        self.modified = {}
+        self._clock = itertools.count()
+
+    async def head(self, key):
+        return {"LastModified": self.modified[key]} if key in self.objects else None
+
+    async def download_bytes(self, key):
+        try:
+            return self.objects[key]
+        except KeyError:
+            raise self.s3.exceptions.NoSuchKey(key) from None
+
+    async def upload_bytes(self, data, key, content_type="image/png"):
+        self.objects[key] = bytes(data)
+        self.modified[key] = datetime.now(timezone.utc) + timedelta(microseconds=next(self._clock))
+        return f"local://{key}"
+
+    async def presign(self, key, expires_in=0):
+        return f"local://{key}"
+
+    async def upload_text(self, text, unique_key):
+        return await self.upload_bytes(text.encode("utf-8"), f"guidance-{unique_key}.txt")
+
+
+class NoCache:
+    def get(self, key):
+        return None
+
+    def put(self, key, result):
+        pass
+
+
+@pytest.fixture
+def fake_mog(monkeypatch, tmp_path):
+    """/mog against FakeS3 with FaceMesh and Gemini stubbed out; "job" and "other-job" hold a face image."""
+    # Imported here so tests that don't touch the API don't pay for loading it
+    import api
+    from gemini_evaluator import schema
+
+    s3 = FakeS3()
+    calls = {"pipeline": 0, "gemini": 0}
+
+    async def run(func, image_bytes):
+        calls["pipeline"] += 1
+        await asyncio.sleep(0.05)
+        return "Round", np.zeros((478, 3), dtype=np.float32), b"mesh", {}
+
+    async def analyze(image_bytes, lane):
+        calls["gemini"] += 1
+        await asyncio.sleep(0.05)
+        return schema.fill_defaults({})
+
+    monkeypatch.setattr(api, "async_s3", s3)
+    monkeypatch.setattr(api, "result_cache", NoCache())
+    monkeypatch.setattr(api, "artifacts", ArtifactStore(str(tmp_path)))
+    monkeypatch.setattr(api, "evaluation_pages", {})
+    monkeypatch.setattr(api.pipeline, "run", run)
+    monkeypatch.setattr(api, "analyze_facial_features_async", analyze)
+    with open("Caleb.png", "rb") as file:
+        s3.objects["job"] = s3.objects["other-job"] = file.read()
+        s3.modified["job"] = s3.modified["other-job"] = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return s3, calls
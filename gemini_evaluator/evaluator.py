@@ -2,123 +2,386 @@
 Facial Features Analysis using Gemini Vision — Clean MWE
 """
 
+import asyncio
+import hashlib
+import io
 import os
 import json
-import re
-from typing import Any, Dict, List
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
 
 from PIL import Image
 from dotenv import load_dotenv
-import google.generativeai as genai
 
-# 1) Load .env from CURRENT directory (adjust if yours is elsewhere)
-load_dotenv()
+from utils import imagePrep, metrics
 
-api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise ValueError("Set GEMINI_API_KEY or GOOGLE_API_KEY in your environment or .env")
-genai.configure(api_key=api_key)
+from gemini_evaluator import scheduler, schema
+
+logger = logging.getLogger(__name__)
+
+# 1) Nothing touches Gemini at import time: google.generativeai takes over a second
+#    to import and needs the API key, so both happen in configure() on first use
+_genai = None
+_configure_lock = threading.Lock()
 
 # 2) Pick one modern, vision-capable model. (gemini-2.0-flash supports images)
 MODEL_NAME = "gemini-2.0-flash"  # or "gemini-1.5-flash" if you prefer
 
-VISION_PROMPT_TEMPLATE = """
-You are a sigma male facial aesthetics coach who gives intentionally over-the-top, meme-worthy advice. Your style combines internet culture, sigma male grindset, and gigachad references. Make suggestions funny but keep them somewhat grounded in real techniques. Return ONLY valid JSON, no extra text.
-
-Schema:
-{
-  "jawline_enhancement": {
-    "current_definition": "Sigma male analysis of jawline potential",
-    "definition_score": 1-10,
-    "mewing_tips": ["Over-the-top mewing advice 1", "Over-the-top mewing advice 2"],
-    "sigma_grindset": ["Funny sigma male lifestyle tip 1", "Funny sigma male lifestyle tip 2"],
-    "gigachad_quotes": ["Motivational quote 1", "Motivational quote 2"]
-  },
-  "eyes_and_eyebrows": {
-    "description": "Meme-worthy analysis of eye area",
-    "sigma_score": 1-10,
-    "suggestions": ["Funny eye area improvement tip 1", "Funny eye area improvement tip 2"]
-  },
-  "nose_structure": {
-    "description": "Chad-like analysis of nose features",
-    "mog_score": 1-10,
-    "suggestions": ["Funny nose improvement tip 1", "Funny nose improvement tip 2"]
-  },
-  "cheekbones": {
-    "description": "Gigachad analysis of bone structure",
-    "bone_score": 1-10,
-    "suggestions": ["Funny bone structure tip 1", "Funny bone structure tip 2"]
-  },
-  "skin_quality": {
-    "description": "Based analysis of skin condition",
-    "zyzz_score": 1-10,
-    "care_recommendations": ["Funny skincare tip 1", "Funny skincare tip 2"]
-  },
-  "facial_harmony": {
-    "balance_description": "Overall sigma potential analysis",
-    "mogger_score": 1-10,
-    "enhancement_suggestions": ["Funny overall improvement tip 1", "Funny overall improvement tip 2"]
-  }
-}
-"""
+# 3) Async client limits: shared quota across concurrent /mog requests. The RPM and
+#    TPM budgets (0 = unlimited) should sit at or just under the project's quota
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 4))
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", 0))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", 0))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 60))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 4))
+GEMINI_BACKOFF_BASE = 0.5  # seconds
+GEMINI_BACKOFF_CAP = 16.0  # seconds
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Charged up front and corrected from the reply's usage_metadata: an inline image is
+# at most four 258-token tiles; the system instruction, schema and reply fit in the rest
+IMAGE_TOKENS_ESTIMATE = 1032
+CALL_TOKENS_ESTIMATE = 1000
+
+# 4) How the image reaches Gemini: "inline" sends downscaled JPEG bytes inside the
+#    generate_content request; "upload" goes through genai.upload_file first
+GEMINI_IMAGE_MODE = os.getenv("GEMINI_IMAGE_MODE", "inline")
+GEMINI_INLINE_MAX_EDGE = int(os.getenv("GEMINI_INLINE_MAX_EDGE", 1024))
+GEMINI_INLINE_QUALITY = int(os.getenv("GEMINI_INLINE_QUALITY", 85))
+# Uploaded files expire server-side after 48h; stop reusing them a little earlier
+GEMINI_UPLOAD_TTL = 47 * 60 * 60
+
+# Bump whenever the prompts or the schema change so cached analyses are not reused
+PROMPT_VERSION = "2"
+
+# Sent once per model as the system instruction, ahead of every request; the
+# output shape lives in GENERATION_CONFIG, so the prompt no longer spells it out
+SYSTEM_PROMPT = (
+    "You are a sigma male facial aesthetics coach who gives intentionally over-the-top, meme-worthy advice. "
+    "Your style combines internet culture, sigma male grindset, and gigachad references. "
+    "Make suggestions funny but keep them somewhat grounded in real techniques."
+)
+ANALYSIS_PROMPT = "Analyze the face in this photo."
+# A malformed reply is sent back as text with what was wrong, without the image
+REPAIR_PROMPT = """Your previous reply did not match the response schema.
+
+Problems:
+{problems}
+
+Previous reply:
+{reply}
+
+Return the corrected analysis."""
 
-def _extract_json(text: str) -> Dict[str, Any]:
-    """Try to parse JSON directly; if that fails, extract the largest JSON block."""
+GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": schema.FacialAnalysis}
+
+# Text-only re-asks for a reply that fails validation before falling back to placeholders
+GEMINI_REPAIR_ATTEMPTS = int(os.getenv("GEMINI_REPAIR_ATTEMPTS", 1))
+# Longer replies are truncated in the repair prompt; a valid analysis is well under this
+REPAIR_REPLY_MAX_CHARS = 8000
+
+
+class IncompleteAnalysis(Exception):
+    """Gemini never produced a valid analysis; .analysis is filled in with placeholders."""
+
+    def __init__(self, analysis: Dict[str, Any], problems: List[str]):
+        super().__init__(f"Gemini analysis incomplete: {'; '.join(problems[:5])}")
+        self.analysis = analysis
+        self.problems = problems
+
+
+def _extract_json(text: str) -> Optional[Any]:
+    """Parse the reply as JSON; failing that, the first complete JSON object in it, or None."""
     try:
         return json.loads(text)
     except json.JSONDecodeError:
         pass
 
-    # Find the first {...} block
-    m = re.search(r"\{.*\}", text, flags=re.DOTALL)
-    if m:
+    # Structured output should make this rare; decode from the first brace and
+    # stop at the end of that object rather than guessing with a greedy regex
+    start = text.find("{")
+    if start != -1:
         try:
-            return json.loads(m.group(0))
+            result, _ = json.JSONDecoder().raw_decode(text, start)
         except json.JSONDecodeError:
             pass
+        else:
+            metrics.GEMINI_PARSE_FALLBACKS.labels("extracted").inc()
+            return result
+
+    metrics.GEMINI_PARSE_FALLBACKS.labels("unparsed").inc()
+    logger.warning("Gemini reply was not valid JSON")
+    return None
+
+
+def _check(text: str):
+    """(parsed reply, problems) for a reply's text; problems is empty when it is a valid analysis."""
+    if not text:
+        return None, ["The reply was empty"]
+    data = _extract_json(text)
+    if data is None:
+        return None, ["The reply was not valid JSON"]
+    return data, schema.validate(data)
+
+
+def _repair_contents(text: str, problems: List[str]) -> List[str]:
+    return [REPAIR_PROMPT.format(
+        problems="\n".join(f"- {problem}" for problem in problems),
+        reply=(text or "")[:REPAIR_REPLY_MAX_CHARS],
+    )]
+
+
+def _give_up(data, problems: List[str]):
+    metrics.GEMINI_PARSE_FALLBACKS.labels("defaulted").inc()
+    logger.warning("Gemini analysis still invalid, using placeholders: %s", problems)
+    raise IncompleteAnalysis(schema.fill_defaults(data), problems)
+
+_model = None
+_scheduler_instance = None
+_scheduler_loop = None
+
+
+def configure():
+    """Import and configure google.generativeai once, returning the module.
+
+    Loads .env from the current directory and raises ValueError if no API key is set.
+    """
+    global _genai
+    with _configure_lock:
+        if _genai is None:
+            load_dotenv()
+            api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise ValueError("Set GEMINI_API_KEY or GOOGLE_API_KEY in your environment or .env")
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _genai = genai
+    return _genai
+
+
+def get_model():
+    """Return the shared GenerativeModel, creating it on first use."""
+    global _model
+    if _model is None:
+        _model = configure().GenerativeModel(
+            MODEL_NAME, generation_config=GENERATION_CONFIG, system_instruction=SYSTEM_PROMPT
+        )
+    return _model
+
+
+def _response_text(resp) -> str:
+    """Prefer .text; fall back to assembling from candidates if needed."""
+    try:
+        text = getattr(resp, "text", None)
+    except ValueError:
+        # .text raises when the reply has no simple text part
+        text = None
 
-    # Give up, but return raw text for debugging
-    return {"raw_analysis": text, "note": "Response was not valid JSON"}
-
-def analyze_facial_features(image_path: str) -> Dict[str, Any]:
-    # Ensure the file exists and is an image
-    Image.open(image_path).verify()  # quick sanity check (raises if invalid)
-
-    # Upload the image to Gemini
-    print(f"Uploading image: {image_path}")
-    file_obj = genai.upload_file(image_path)  # returns a File handle
-    print("Image uploaded successfully")
-
-    print("Creating Gemini model...")
-    model = genai.GenerativeModel(MODEL_NAME)
-    print("Sending request to Gemini...")
-    resp = model.generate_content([VISION_PROMPT_TEMPLATE, file_obj])
-    print("Raw response from Gemini:", resp)
-
-    # Prefer .text; fall back to assembling from candidates if needed
-    print("Getting response text...")
-    text = getattr(resp, "text", None)
-    print("Direct text attribute:", text)
-    
     if not text and getattr(resp, "candidates", None):
-        print("No direct text, checking candidates...")
+        logger.debug("No direct text, checking candidates...")
         parts: List[str] = []
         for c in resp.candidates:
-            print("Candidate:", c)
             for p in getattr(c.content, "parts", []) or []:
                 if hasattr(p, "text"):
-                    print("Found text part:", p.text)
                     parts.append(p.text)
         text = "\n".join(parts).strip()
-        print("Assembled text from parts:", text)
+    return text
 
-    if not text:
-        return {
-            "error": "No analysis generated",
-            "details": "Model returned no text. Check model name and image input."
-        }
 
-    return _extract_json(text)
+# A file path or the encoded image bytes
+ImageInput = Union[str, bytes, bytearray, memoryview]
+
+_uploads: Dict[str, Any] = {}
+_uploads_lock = threading.Lock()
+
+
+def _image_source(image: ImageInput):
+    """Paths pass through; raw bytes are wrapped so PIL can read them without a temp file."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return io.BytesIO(image)
+    return image
+
+
+def _inline_image_part(image: ImageInput) -> Dict[str, Any]:
+    """Downscale and re-encode the image as an inline JPEG blob."""
+    img = imagePrep.open_image(_image_source(image), max_edge=GEMINI_INLINE_MAX_EDGE)
+    return {"mime_type": "image/jpeg", "data": imagePrep.encode_jpeg(img, GEMINI_INLINE_QUALITY)}
+
+
+def _uploaded_image_part(image: ImageInput):
+    """Upload the image via the File API, reusing an earlier upload of the same bytes."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        data = bytes(image)
+    else:
+        with open(image, "rb") as file:
+            data = file.read()
+    with Image.open(io.BytesIO(data)) as img:
+        mime_type = imagePrep.mime_type(img.format, "image/png")
+        img.verify()  # quick sanity check (raises if invalid)
+    digest = hashlib.sha256(data).hexdigest()
+
+    now = time.monotonic()
+    with _uploads_lock:
+        cached = _uploads.get(digest)
+        if cached is not None and now - cached[0] < GEMINI_UPLOAD_TTL:
+            return cached[1]
+
+    logger.debug("Uploading image %s", digest[:12])
+    file_obj = configure().upload_file(io.BytesIO(data), mime_type=mime_type)  # returns a File handle
+    with _uploads_lock:
+        _uploads[digest] = (now, file_obj)
+    return file_obj
+
+
+def _image_part(image: ImageInput):
+    if GEMINI_IMAGE_MODE == "upload":
+        return _uploaded_image_part(image)
+    return _inline_image_part(image)
+
+
+def analyze_facial_features(image: ImageInput) -> Dict[str, Any]:
+    """Analyze an image given as a file path or raw encoded bytes.
+
+    Raises IncompleteAnalysis if no valid analysis comes back after the repair re-asks.
+    """
+    image_part = _image_part(image)
+    model = get_model()
+
+    logger.debug("Sending request to Gemini...")
+    resp = model.generate_content([ANALYSIS_PROMPT, image_part])
+    # Lazily formatted, so the response is only stringified at DEBUG
+    logger.debug("Raw response from Gemini: %s", resp)
+    text = _response_text(resp)
+    data, problems = _check(text)
+
+    for _ in range(GEMINI_REPAIR_ATTEMPTS):
+        if not problems:
+            break
+        logger.info("Re-asking Gemini to fix its reply: %s", problems)
+        text = _response_text(model.generate_content(_repair_contents(text, problems)))
+        data, problems = _check(text)
+        if not problems:
+            metrics.GEMINI_PARSE_FALLBACKS.labels("repaired").inc()
+
+    if problems:
+        _give_up(data, problems)
+    return data
+
+
+# ---------------------- Async variant -------------------------
+
+def _scheduler() -> scheduler.GeminiScheduler:
+    # asyncio primitives are bound to one loop, so rebuild if the loop changed
+    global _scheduler_instance, _scheduler_loop
+    loop = asyncio.get_running_loop()
+    if _scheduler_instance is None or _scheduler_loop is not loop:
+        _scheduler_instance = scheduler.GeminiScheduler(GEMINI_RPM, GEMINI_TPM, GEMINI_MAX_CONCURRENCY)
+        _scheduler_loop = loop
+    return _scheduler_instance
+
+
+def _estimate_tokens(contents: List[Any]) -> int:
+    return CALL_TOKENS_ESTIMATE + sum(
+        len(part) // 4 if isinstance(part, str) else IMAGE_TOKENS_ESTIMATE for part in contents
+    )
+
+
+def _used_tokens(resp) -> Optional[int]:
+    usage = getattr(resp, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or None
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    # google.api_core exceptions carry the HTTP status as .code
+    return getattr(exc, "code", None) in RETRYABLE_STATUS_CODES
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(GEMINI_BACKOFF_CAP, GEMINI_BACKOFF_BASE * 2 ** attempt))
+
+
+async def _call_with_retry(call, timeout: float, max_retries: int, lane: str, tokens: int = 0, requests: int = 1):
+    """Await call() in a scheduler slot, retrying 429/5xx and timeouts.
+
+    Every attempt is charged requests and tokens against the budgets in lane's turn.
+    """
+    for attempt in range(max_retries + 1):
+        limiter = _scheduler()
+        try:
+            async with limiter.slot(lane, tokens, requests) as grant:
+                try:
+                    result = await asyncio.wait_for(call(), timeout)
+                except Exception as e:
+                    # Drain the buckets before the slot is released, or it goes straight to the next call
+                    if getattr(e, "code", None) == 429:
+                        limiter.throttled()
+                    raise
+                grant.tokens = _used_tokens(result) or grant.tokens
+                return result
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            delay = _backoff_delay(attempt)
+            logger.warning("Gemini call failed (%r), retry %d/%d in %.2fs", e, attempt + 1, max_retries, delay)
+            await asyncio.sleep(delay)
+
+
+async def analyze_facial_features_async(
+    image: ImageInput,
+    model=None,
+    timeout: float = GEMINI_TIMEOUT,
+    max_retries: int = GEMINI_MAX_RETRIES,
+    lane: str = scheduler.DEFAULT_LANE,
+) -> Dict[str, Any]:
+    """Async analyze_facial_features sharing one model, the scheduler and retry policy.
+
+    lane picks the scheduler priority (see scheduler.LANES). Raises
+    IncompleteAnalysis if no valid analysis comes back after the repair re-asks.
+    """
+    if GEMINI_IMAGE_MODE == "upload":
+        with metrics.timed("gemini_upload"):
+            # File API calls have their own quota: they take a concurrency slot but no budget
+            image_part = await _call_with_retry(
+                lambda: asyncio.to_thread(_uploaded_image_part, image), timeout, max_retries, lane, requests=0
+            )
+    else:
+        with metrics.timed("gemini_encode"):
+            image_part = await asyncio.to_thread(_inline_image_part, image)
+
+    # Off the loop: the first call imports and configures the Gemini SDK
+    model = model or await asyncio.to_thread(get_model)
+    contents = [ANALYSIS_PROMPT, image_part]
+    # Includes waiting for the scheduler and any retries
+    with metrics.timed("gemini_generate"):
+        resp = await _call_with_retry(
+            lambda: model.generate_content_async(contents), timeout, max_retries, lane, _estimate_tokens(contents)
+        )
+    logger.debug("Raw response from Gemini: %s", resp)
+    text = _response_text(resp)
+    data, problems = _check(text)
+
+    for _ in range(GEMINI_REPAIR_ATTEMPTS):
+        if not problems:
+            break
+        logger.info("Re-asking Gemini to fix its reply: %s", problems)
+        contents = _repair_contents(text, problems)
+        with metrics.timed("gemini_repair"):
+            resp = await _call_with_retry(
+                lambda: model.generate_content_async(contents), timeout, max_retries, lane, _estimate_tokens(contents)
+            )
+        text = _response_text(resp)
+        data, problems = _check(text)
+        if not problems:
+            metrics.GEMINI_PARSE_FALLBACKS.labels("repaired").inc()
+
+    if problems:
+        _give_up(data, problems)
+    return data
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,137 @@
+"""
+Admission control for Gemini calls: requests-per-minute and tokens-per-minute
+budgets, a concurrency cap, and priority lanes, shared by every caller on the loop.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+
+from utils import metrics
+
+# Lower runs first. ACP TRANSACTION deliveries are paid for; everything else is
+# ad-hoc traffic that can wait for quota
+LANES = {"delivery": 0, "default": 1}
+DEFAULT_LANE = "default"
+
+
+class _Bucket:
+    """Token bucket refilled continuously at per_minute / 60 per second; 0 means unlimited.
+
+    Holding only burst_seconds worth spreads calls evenly across the minute, so
+    the server's per-minute window never sees a burst it would reject.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, amount: float) -> float:
+        """Seconds until amount can be taken; anything over capacity only needs a full bucket."""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        # Can go negative: estimates corrected upwards and over-capacity calls are paid back over time
+        if self.rate:
+            self._refill()
+            self.level -= amount
+
+    def drain(self):
+        if self.rate:
+            self._refill()
+            self.level = min(self.level, 0.0)
+
+
+class Grant:
+    """A granted call. Set .tokens to the real usage once known so the budget is corrected."""
+
+    def __init__(self, lane: str, tokens: int):
+        self.lane = lane
+        self.estimate = tokens
+        self.tokens = tokens
+
+
+class GeminiScheduler:
+    """Hands out call slots in lane order once the budgets and concurrency cap allow.
+
+    Strictly by priority: a waiting delivery holds back every default-lane call,
+    and within a lane calls go first come, first served. Bound to the event loop
+    it is first used on.
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, max_concurrency: int = 4, burst_seconds: float = 10):
+        self._requests = _Bucket(rpm, burst_seconds)
+        self._tokens = _Bucket(tpm, burst_seconds)
+        self._free = max_concurrency
+        self._waiting = []  # heap of (priority, sequence, future, requests, tokens)
+        self._sequence = itertools.count()
+        self._timer = None
+
+    @asynccontextmanager
+    async def slot(self, lane: str = DEFAULT_LANE, tokens: int = 0, requests: int = 1):
+        """Wait for budget and a concurrency slot, then hold the slot for the block."""
+        grant = Grant(lane, tokens)
+        await self._acquire(lane, tokens, requests)
+        try:
+            yield grant
+        finally:
+            self._tokens.take(grant.tokens - grant.estimate)
+            metrics.GEMINI_TOKENS.labels(lane).inc(grant.tokens)
+            self._free += 1
+            self._dispatch()
+
+    def throttled(self):
+        """The server rejected a call for quota: stop admitting until the buckets refill."""
+        self._requests.drain()
+        self._tokens.drain()
+
+    async def _acquire(self, lane: str, tokens: int, requests: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (LANES[lane], next(self._sequence), future, requests, tokens))
+        metrics.GEMINI_QUEUE_DEPTH.labels(lane).inc()
+        started = time.perf_counter()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled: hand the slot back
+                self._free += 1
+                self._dispatch()
+            raise
+        finally:
+            metrics.GEMINI_QUEUE_DEPTH.labels(lane).dec()
+            metrics.GEMINI_QUEUE_SECONDS.labels(lane).observe(time.perf_counter() - started)
+
+    def _dispatch(self):
+        while self._waiting and self._free > 0:
+            _, _, future, requests, tokens = self._waiting[0]
+            if future.done():  # cancelled while queued
+                heapq.heappop(self._waiting)
+                continue
+            delay = max(self._requests.wait(requests), self._tokens.wait(tokens))
+            if delay > 0:
+                self._wake_in(delay)
+                return
+            heapq.heappop(self._waiting)
+            self._requests.take(requests)
+            self._tokens.take(tokens)
+            self._free -= 1
+            future.set_result(None)
+
+    def _wake_in(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
@@ -0,0 +1,142 @@
+"""
+Typed result of a facial analysis, used both as Gemini's response_schema and to
+validate what comes back before /mog renders it.
+"""
+
+from typing import Annotated, Any, Dict, List, get_args, get_origin
+
+import pydantic
+from typing_extensions import TypedDict
+
+# Gemini's schema has no min/max, so these are checked in validate() instead
+SCORE_RANGE = (1, 10)
+MIN_ITEMS = 2
+
+PLACEHOLDER_TEXT = "Analysis unavailable"
+PLACEHOLDER_TIP = "Stay sigma and try again later"
+
+
+def _text(description: str):
+    return Annotated[str, pydantic.Field(description=description)]
+
+
+def _score(description: str):
+    return Annotated[int, pydantic.Field(description=f"{description}, 1-10")]
+
+
+def _tips(description: str):
+    return Annotated[List[str], pydantic.Field(description=f"Exactly two {description}")]
+
+
+class JawlineEnhancement(TypedDict):
+    current_definition: _text("Sigma male analysis of jawline potential")
+    definition_score: _score("Jawline definition score")
+    mewing_tips: _tips("over-the-top mewing tips")
+    sigma_grindset: _tips("funny sigma male lifestyle tips")
+    gigachad_quotes: _tips("motivational gigachad quotes")
+
+
+class EyesAndEyebrows(TypedDict):
+    description: _text("Meme-worthy analysis of the eye area")
+    sigma_score: _score("Eye area score")
+    suggestions: _tips("funny eye area improvement tips")
+
+
+class NoseStructure(TypedDict):
+    description: _text("Chad-like analysis of nose features")
+    mog_score: _score("Nose score")
+    suggestions: _tips("funny nose improvement tips")
+
+
+class Cheekbones(TypedDict):
+    description: _text("Gigachad analysis of bone structure")
+    bone_score: _score("Bone structure score")
+    suggestions: _tips("funny bone structure tips")
+
+
+class SkinQuality(TypedDict):
+    description: _text("Based analysis of skin condition")
+    zyzz_score: _score("Skin score")
+    care_recommendations: _tips("funny skincare tips")
+
+
+class FacialHarmony(TypedDict):
+    balance_description: _text("Overall sigma potential analysis")
+    mogger_score: _score("Overall mogger score")
+    enhancement_suggestions: _tips("funny overall improvement tips")
+
+
+class FacialAnalysis(TypedDict):
+    jawline_enhancement: JawlineEnhancement
+    eyes_and_eyebrows: EyesAndEyebrows
+    nose_structure: NoseStructure
+    cheekbones: Cheekbones
+    skin_quality: SkinQuality
+    facial_harmony: FacialHarmony
+
+
+_adapter = None
+
+
+def _sections():
+    """(section name, {field name: str, int or list}) for every section, in schema order."""
+    for section, section_type in FacialAnalysis.__annotations__.items():
+        fields = {}
+        for name, hint in section_type.__annotations__.items():
+            base = get_args(hint)[0]  # strip Annotated
+            fields[name] = get_origin(base) or base
+        yield section, fields
+
+
+def validate(data: Any) -> List[str]:
+    """Check data against FacialAnalysis, returning readable problems (empty if valid).
+
+    Scores are normalized in place: numeric strings become ints and values are
+    clamped to SCORE_RANGE, neither of which is worth a re-ask.
+    """
+    global _adapter
+    if _adapter is None:
+        _adapter = pydantic.TypeAdapter(FacialAnalysis)
+    try:
+        _adapter.validate_python(data)
+        problems = []
+    except pydantic.ValidationError as e:
+        problems = [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+    if not isinstance(data, dict):
+        return problems
+
+    for section, fields in _sections():
+        given = data.get(section)
+        if not isinstance(given, dict):
+            continue
+        for name, kind in fields.items():
+            value = given.get(name)
+            if kind is int:
+                try:
+                    given[name] = min(max(int(value), SCORE_RANGE[0]), SCORE_RANGE[1])
+                except (TypeError, ValueError):
+                    pass
+            elif kind is list and isinstance(value, list) and len(value) < MIN_ITEMS:
+                problems.append(f"{section}.{name}: needs at least {MIN_ITEMS} items")
+    return problems
+
+
+def fill_defaults(data: Any) -> Dict[str, Any]:
+    """A complete FacialAnalysis from whatever parts of data are usable, with placeholders for the rest."""
+    data = data if isinstance(data, dict) else {}
+    result = {}
+    for section, fields in _sections():
+        given = data.get(section) if isinstance(data.get(section), dict) else {}
+        filled = {}
+        for name, kind in fields.items():
+            value = given.get(name)
+            if kind is str:
+                filled[name] = value if isinstance(value, str) and value else PLACEHOLDER_TEXT
+            elif kind is int:
+                valid = isinstance(value, int) and not isinstance(value, bool)
+                filled[name] = min(max(value, SCORE_RANGE[0]), SCORE_RANGE[1]) if valid else SCORE_RANGE[0]
+            else:
+                items = [item for item in value if isinstance(item, str)] if isinstance(value, list) else []
+                filled[name] = (items + [PLACEHOLDER_TIP] * MIN_ITEMS)[:max(len(items), MIN_ITEMS)]
+        result[section] = filled
+    return result
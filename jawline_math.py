@@ -1,9 +1,19 @@
-import streamlit as st
-import cv2
 import numpy as np
-import mediapipe as mp
 import math
 import os
+import queue
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import cache
+from typing import Optional
+
+from PIL import Image
+
+# mediapipe and cv2 are imported where they're used: they cost over a second to
+# load, and the API process never needs them when landmarking runs in workers
+
+from utils import imagePrep
 
 
 # ---------------------- Helper Functions -------------------------
@@ -14,57 +24,375 @@ def distance(point1, point2, image_shape):
     x2, y2 = int(point2.x * iw), int(point2.y * ih)
     return math.hypot(x2 - x1, y2 - y1)
 
-def draw_face_landmarks(image):
-    mp_face_mesh = mp.solutions.face_mesh
-    face_mesh = mp_face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1, refine_landmarks=True)
-    drawing_spec = mp.solutions.drawing_utils.DrawingSpec(thickness=1, circle_radius=1)
+# ---------------------- Landmark Geometry -------------------------
+
+# MediaPipe FaceMesh landmark indices used by the geometry below
+JAW_INDICES = np.arange(0, 17)
+JAW_LEFT, JAW_RIGHT = 0, 16
+CHEEKBONE_LEFT, CHEEKBONE_RIGHT = 234, 454
+FOREHEAD_TOP, CHIN_BOTTOM = 10, 152
+_RATIO_INDICES = [JAW_LEFT, JAW_RIGHT, CHEEKBONE_LEFT, CHEEKBONE_RIGHT, FOREHEAD_TOP, CHIN_BOTTOM]
+
+
+def landmarks_to_array(landmarks) -> np.ndarray:
+    """Convert MediaPipe landmarks to a contiguous (N, 3) float32 array of normalized x, y, z."""
+    if isinstance(landmarks, np.ndarray):
+        return np.ascontiguousarray(landmarks, dtype=np.float32)
+    return np.array([(lm.x, lm.y, lm.z) for lm in landmarks], dtype=np.float32)
+
+
+def to_pixels(points: np.ndarray, image_shape) -> np.ndarray:
+    """Scale normalized landmarks to integer pixel coordinates.
+
+    points is (N, 3) or (B, N, 3); image_shape is (h, w) or one (h, w) per face.
+    Coordinates are truncated like int() so results match the per-point math.
+    """
+    size = np.asarray(image_shape, dtype=np.float64)[..., ::-1]
+    if size.ndim == 2:
+        size = size[:, np.newaxis, :]
+    return np.trunc(points[..., :2] * size).astype(np.int32)
+
+
+def bounding_box(pixels: np.ndarray):
+    """Return ((x_min, y_min), (x_max, y_max)) of an (N, 2) pixel array."""
+    (x_min, y_min), (x_max, y_max) = pixels.min(axis=0), pixels.max(axis=0)
+    return (int(x_min), int(y_min)), (int(x_max), int(y_max))
+
+
+def face_ratios(points: np.ndarray, image_shape):
+    """Return (face height / cheekbone width, cheekbone width / jaw width) for one or many faces."""
+    # Only the six measurement landmarks are scaled, not all N points
+    pixels = to_pixels(points[..., _RATIO_INDICES, :], image_shape).astype(np.float64)
+    spans = np.linalg.norm(pixels[..., 1::2, :] - pixels[..., 0::2, :], axis=-1)
+    jaw_width, cheekbone_width, face_height = spans[..., 0], spans[..., 1], spans[..., 2]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio1 = np.where(cheekbone_width != 0, face_height / cheekbone_width, 0.0)
+        ratio2 = np.where(jaw_width != 0, cheekbone_width / jaw_width, 0.0)
+    return ratio1, ratio2
+
+
+def _shape_from_ratios(ratio1, ratio2) -> np.ndarray:
+    return np.select(
+        [
+            ratio1 > 1.5,
+            (ratio1 < 1.2) & (ratio2 > 1.05),
+            (1.2 <= ratio1) & (ratio1 <= 1.5) & (0.9 <= ratio2) & (ratio2 <= 1.05),
+        ],
+        ["Long", "Round", "Oval"],
+        default="Square",
+    )
+
+# ---------------------- FaceMesh Pool -------------------------
+
+FACEMESH_POOL_SIZE = int(os.getenv("FACEMESH_POOL_SIZE", os.cpu_count() or 1))
+
+
+class FaceMeshPool:
+    """Bounded, thread-safe pool of reusable FaceMesh landmarkers.
+
+    Building a FaceMesh graph loads the model, which costs more than a single
+    inference, so instances are created lazily up to ``size`` and handed out
+    to one caller at a time instead of being rebuilt per request.
+    """
+
+    def __init__(self, size: int = FACEMESH_POOL_SIZE, **face_mesh_kwargs):
+        if size < 1:
+            raise ValueError("FaceMesh pool size must be at least 1")
+        self.size = size
+        self._face_mesh_kwargs = {
+            "static_image_mode": True,
+            "max_num_faces": 1,
+            "refine_landmarks": True,
+            **face_mesh_kwargs,
+        }
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._instances = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _checkout(self, timeout=None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("FaceMesh pool is closed")
+            if len(self._instances) < self.size:
+                import mediapipe as mp
+                face_mesh = mp.solutions.face_mesh.FaceMesh(**self._face_mesh_kwargs)
+                self._instances.append(face_mesh)
+                return face_mesh
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("Timed out waiting for a free FaceMesh instance") from None
+
+    def _release(self, face_mesh):
+        # Under the lock, so close() either sees this instance in _idle or has already
+        # set _closed; otherwise it could slip back in after close() drained the queue
+        with self._lock:
+            if self._closed:
+                face_mesh.close()
+            else:
+                self._idle.put_nowait(face_mesh)
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """Borrow a landmarker for the duration of the ``with`` block."""
+        face_mesh = self._checkout(timeout)
+        try:
+            yield face_mesh
+        finally:
+            self._release(face_mesh)
+
+    def warm_up(self):
+        """Create every instance up front and run one inference on each."""
+        blank = np.zeros((64, 64, 3), dtype=np.uint8)
+        borrowed = [self._checkout() for _ in range(self.size)]
+        try:
+            for face_mesh in borrowed:
+                face_mesh.process(blank)
+        finally:
+            for face_mesh in borrowed:
+                self._release(face_mesh)
+
+    def close(self):
+        """Close idle instances now; borrowed ones are closed when returned."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_face_mesh_pool = None
+_face_mesh_pool_lock = threading.Lock()
+
+
+def get_face_mesh_pool() -> FaceMeshPool:
+    """Return the process-wide pool, creating it on first use."""
+    global _face_mesh_pool
+    with _face_mesh_pool_lock:
+        if _face_mesh_pool is None:
+            _face_mesh_pool = FaceMeshPool()
+        return _face_mesh_pool
+
+
+def init_face_mesh_pool(size: int = FACEMESH_POOL_SIZE, warm_up: bool = False) -> FaceMeshPool:
+    """Replace the process-wide pool, e.g. with a single instance per worker process."""
+    global _face_mesh_pool
+    with _face_mesh_pool_lock:
+        if _face_mesh_pool is not None:
+            _face_mesh_pool.close()
+        pool = _face_mesh_pool = FaceMeshPool(size=size)
+    if warm_up:
+        pool.warm_up()
+    return pool
+
+
+def close_face_mesh_pool():
+    global _face_mesh_pool
+    with _face_mesh_pool_lock:
+        if _face_mesh_pool is not None:
+            _face_mesh_pool.close()
+            _face_mesh_pool = None
+
+
+# ---------------------- Mesh Rendering -------------------------
 
-    image_np = np.array(image.convert('RGB'))
-    results = face_mesh.process(image_np)
+MESH_COLOR = (224, 224, 224)  # drawing_utils' default connection colour
+JAW_COLOR = (0, 255, 0)
+BOX_COLOR = (0, 0, 255)
+
+MESH_FORMAT = os.getenv("MESH_FORMAT", "png")  # png, jpeg or webp
+MESH_QUALITY = int(os.getenv("MESH_QUALITY", 85))
+MESH_CONTENT_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+@cache
+def tesselation_edges() -> np.ndarray:
+    """Tessellation as an (E, 2) index array, built once instead of walked edge by edge."""
+    import mediapipe as mp
+    return np.array(sorted(mp.solutions.face_mesh.FACEMESH_TESSELATION), dtype=np.intp)
+
+
+def __getattr__(name):
+    # Keeps jm.TESSELATION_EDGES working without importing mediapipe up front
+    if name == "TESSELATION_EDGES":
+        return tesselation_edges()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def draw_tessellation(annotated_image: np.ndarray, points: np.ndarray, pixels: Optional[np.ndarray] = None):
+    """Draw the FaceMesh tessellation in place, pixel for pixel like drawing_utils.draw_landmarks."""
+    import cv2
+    h, w, _ = annotated_image.shape
+    if pixels is None:
+        pixels = to_pixels(points, (h, w))
+    # Like drawing_utils, skip edges with an endpoint outside the frame and clamp x = 1 / y = 1 to the last pixel
+    in_frame = ((points[:, :2] >= 0) & (points[:, :2] <= 1)).all(axis=1)
+    all_edges = tesselation_edges()
+    edges = all_edges[in_frame[all_edges].all(axis=1)]
+    segments = np.minimum(pixels, (w - 1, h - 1))[edges]
+    cv2.polylines(annotated_image, segments, isClosed=False, color=MESH_COLOR, thickness=1)
+
+
+def render_mesh(annotated_image: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Draw the tessellation, jaw polyline and bounding box onto annotated_image in place."""
+    import cv2
+    h, w, _ = annotated_image.shape
+    pixels = to_pixels(points, (h, w))
+    draw_tessellation(annotated_image, points, pixels)
+
+    # Draw jawline in green
+    cv2.polylines(annotated_image, [pixels[JAW_INDICES]], isClosed=False, color=JAW_COLOR, thickness=2)
+
+    # Draw bounding box
+    top_left, bottom_right = bounding_box(pixels)
+    cv2.rectangle(annotated_image, top_left, bottom_right, BOX_COLOR, 2)
+    return annotated_image
+
+
+def encode_mesh(annotated_image: np.ndarray, fmt: str = MESH_FORMAT, quality: int = MESH_QUALITY) -> bytes:
+    """Encode an RGB mesh overlay as PNG, JPEG or WebP bytes."""
+    import cv2
+    if fmt == "png":
+        params = [cv2.IMWRITE_PNG_COMPRESSION, 3]
+    elif fmt == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif fmt == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        raise ValueError(f"Unsupported mesh format: {fmt}")
+    ok, encoded = cv2.imencode(f".{fmt}", cv2.cvtColor(annotated_image, cv2.COLOR_RGB2BGR), params)
+    if not ok:
+        raise ValueError(f"Could not encode mesh as {fmt}")
+    return encoded.tobytes()
+
+
+# ---------------------- Landmark Detection -------------------------
+
+def draw_face_landmarks(image, pool: FaceMeshPool = None, max_edge: int = imagePrep.LANDMARK_MAX_EDGE):
+    """Run FaceMesh on a PIL image.
+
+    Detection runs on a copy downscaled to max_edge; landmarks are normalized,
+    so they are drawn back onto the full-resolution, EXIF-oriented image.
+    Returns (annotated RGB array, (N, 3) float32 landmark array) or (None, None).
+    """
+    image = imagePrep.normalize(image)
+    detect_image = imagePrep.downscale(image, max_edge)
+    with (pool or get_face_mesh_pool()).acquire() as face_mesh:
+        results = face_mesh.process(np.asarray(detect_image))
 
     if results.multi_face_landmarks:
-        annotated_image = image_np.copy()
+        # np.array copies out of PIL, so the overlay can be drawn on it directly
+        annotated_image = np.array(image)
+        points = None
         for face_landmarks in results.multi_face_landmarks:
-            mp.solutions.drawing_utils.draw_landmarks(
-                image=annotated_image,
-                landmark_list=face_landmarks,
-                connections=mp_face_mesh.FACEMESH_TESSELATION,
-                landmark_drawing_spec=None,
-                connection_drawing_spec=drawing_spec)
-
-            # Draw jawline in green
-            jaw_indices = list(range(0, 17))
-            h, w, _ = image_np.shape
-            jaw_points = [(int(face_landmarks.landmark[i].x * w), int(face_landmarks.landmark[i].y * h)) for i in jaw_indices]
-            cv2.polylines(annotated_image, [np.array(jaw_points)], isClosed=False, color=(0, 255, 0), thickness=2)
-
-            # Draw bounding box
-            x_coords = [int(lm.x * w) for lm in face_landmarks.landmark]
-            y_coords = [int(lm.y * h) for lm in face_landmarks.landmark]
-            x_min, x_max = min(x_coords), max(x_coords)
-            y_min, y_max = min(y_coords), max(y_coords)
-            cv2.rectangle(annotated_image, (x_min, y_min), (x_max, y_max), (0, 0, 255), 2)
-
-        return annotated_image, results.multi_face_landmarks[0].landmark
+            face_points = landmarks_to_array(face_landmarks.landmark)
+            render_mesh(annotated_image, face_points)
+            if points is None:
+                points = face_points
+
+        return annotated_image, points
     else:
         return None, None
 
 def classify_face_shape(landmarks, image_shape):
-    jaw_width = distance(landmarks[0], landmarks[16], image_shape)
-    cheekbone_width = distance(landmarks[234], landmarks[454], image_shape)
-    face_height = distance(landmarks[10], landmarks[152], image_shape)
-
-    ratio1 = face_height / cheekbone_width if cheekbone_width else 0
-    ratio2 = cheekbone_width / jaw_width if jaw_width else 0
-
-    if ratio1 > 1.5:
-        return "Long"
-    elif ratio1 < 1.2 and ratio2 > 1.05:
-        return "Round"
-    elif 1.2 <= ratio1 <= 1.5 and 0.9 <= ratio2 <= 1.05:
-        return "Oval"
-    else:
-        return "Square"
+    """Classify one face from MediaPipe landmarks or an (N, 3) landmark array."""
+    ratio1, ratio2 = face_ratios(landmarks_to_array(landmarks), image_shape)
+    return str(_shape_from_ratios(ratio1, ratio2))
+
+def classify_face_shapes(landmark_batch, image_shapes) -> list:
+    """Classify many faces in one vectorized call, e.g. to re-score stored landmarks.
+
+    landmark_batch is a (B, N, 3) array (or a list of (N, 3) arrays); image_shapes is
+    a single (h, w) shared by every face or one (h, w) per face.
+    """
+    points = np.asarray(landmark_batch, dtype=np.float32)
+    if len(points) == 0:
+        return []
+    image_shapes = np.broadcast_to(np.asarray(image_shapes), (len(points), 2))
+    ratio1, ratio2 = face_ratios(points, image_shapes)
+    return _shape_from_ratios(ratio1, ratio2).tolist()
+
+# ---------------------- Video Tracking -------------------------
+
+# EMA weight of the newest frame when smoothing jaw ratios across frames
+VIDEO_SMOOTHING = float(os.getenv("VIDEO_SMOOTHING", 0.3))
+
+
+class FaceTracker:
+    """FaceMesh in tracking mode for one video or frame stream.
+
+    Full face detection only runs on the first frame and after the track is
+    lost; in between, landmarks are refined from the previous frame, which is
+    a fraction of the static-image cost. The trackers are stateful, so each
+    stream gets its own instance rather than one from the FaceMesh pool.
+    """
+
+    def __init__(self, smoothing: float = VIDEO_SMOOTHING,
+                 max_edge: int = imagePrep.LANDMARK_MAX_EDGE, **face_mesh_kwargs):
+        import mediapipe as mp
+        self._face_mesh = mp.solutions.face_mesh.FaceMesh(**{
+            "static_image_mode": False,
+            "max_num_faces": 1,
+            "refine_landmarks": True,
+            **face_mesh_kwargs,
+        })
+        self.smoothing = smoothing
+        self.max_edge = max_edge
+        self.ratios = None  # smoothed (face height / cheekbone width, cheekbone width / jaw width)
+        self.frames = 0
+        self.frames_with_face = 0
+        self.shape_votes = Counter()
+
+    def process(self, frame: np.ndarray):
+        """Track one RGB frame, returning its (N, 3) landmark array or None if no face."""
+        self.frames += 1
+        detect_frame = frame
+        if self.max_edge > 0 and max(frame.shape[:2]) > self.max_edge:
+            detect_frame = np.asarray(imagePrep.downscale(Image.fromarray(frame), self.max_edge))
+        results = self._face_mesh.process(detect_frame)
+        if not results.multi_face_landmarks:
+            return None
+
+        points = landmarks_to_array(results.multi_face_landmarks[0].landmark)
+        ratios = np.array(face_ratios(points, frame.shape[:2]), dtype=np.float64)
+        if self.ratios is None:
+            self.ratios = ratios
+        else:
+            self.ratios = self.smoothing * ratios + (1 - self.smoothing) * self.ratios
+        self.frames_with_face += 1
+        self.shape_votes[self.face_shape] += 1
+        return points
+
+    @property
+    def face_shape(self):
+        """Shape from the current smoothed ratios, or None before the first face."""
+        if self.ratios is None:
+            return None
+        return str(_shape_from_ratios(*self.ratios))
+
+    def verdict(self):
+        """The shape most smoothed frames agreed on, or None if no face was seen."""
+        if not self.shape_votes:
+            return None
+        return self.shape_votes.most_common(1)[0][0]
+
+    def close(self):
+        self._face_mesh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 
 def recommend_exercises():
     return [
@@ -0,0 +1,195 @@
+"""
+Worker pool for the CPU-bound stages of /mog (FaceMesh + mesh rendering).
+
+The API handlers are async, so anything that burns CPU is shipped to a pool
+of worker processes (or threads when MOG_WORKERS=0) instead of stalling the
+uvicorn event loop.
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+from typing import List, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+import jawline_math as jm
+from utils import imagePrep, metrics
+
+# Number of worker processes; 0 keeps the work in the default thread pool
+MOG_WORKERS = int(os.getenv("MOG_WORKERS", os.cpu_count() or 1))
+
+# Frames analyzed per video (the rest are skipped) and mesh overlays returned
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", 300))
+VIDEO_MESH_SAMPLES = int(os.getenv("VIDEO_MESH_SAMPLES", 4))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    # Each worker process owns exactly one warmed-up landmarker
+    jm.init_face_mesh_pool(size=1, warm_up=True)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def detect_and_render(image_bytes: bytes):
+    """Detect landmarks, classify the face shape and render the encoded mesh overlay.
+
+    Returns (face shape, (N, 3) landmark array, mesh bytes in jm.MESH_FORMAT, stage
+    timings), with None for the first three when no face was found. The timings
+    are returned rather than observed because this usually runs in a worker process.
+    """
+    timings = {}
+    with metrics.timed("decode", timings):
+        img = imagePrep.normalize(Image.open(io.BytesIO(image_bytes)))
+        img.load()
+    # Includes drawing the overlay, which is a small fraction of detection
+    with metrics.timed("facemesh", timings):
+        output_image, landmarks = jm.draw_face_landmarks(img)
+    if output_image is None or landmarks is None:
+        return None, None, None, timings
+
+    # Landmarks are relative to the EXIF-oriented image, which is what output_image is
+    with metrics.timed("classify", timings):
+        jawline_shape = jm.classify_face_shape(landmarks, output_image.shape[:2])
+    with metrics.timed("mesh_encode", timings):
+        mesh = jm.encode_mesh(output_image)
+    return jawline_shape, landmarks, mesh, timings
+
+
+def _video_frames(video_bytes: bytes):
+    """Yield (estimated frame count, RGB frames) decoded from an encoded video."""
+    import cv2
+    # OpenCV only decodes from a path, so the upload is spooled to a temp file
+    with tempfile.NamedTemporaryFile(suffix=".video") as file:
+        file.write(video_bytes)
+        file.flush()
+        capture = cv2.VideoCapture(file.name)
+        if not capture.isOpened():
+            raise ValueError("Could not decode video")
+        try:
+            total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or VIDEO_MAX_FRAMES
+            yield min(total, VIDEO_MAX_FRAMES)
+            for _ in range(VIDEO_MAX_FRAMES):
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        finally:
+            capture.release()
+
+
+def _image_frames(frames: List[bytes]):
+    """Yield (frame count, RGB frames) from a list of encoded still images."""
+    frames = frames[:VIDEO_MAX_FRAMES]
+    yield len(frames)
+    for data in frames:
+        yield np.asarray(imagePrep.normalize(Image.open(io.BytesIO(data))))
+
+
+def track_video(source: Union[bytes, List[bytes]]):
+    """Track a face through a video (bytes) or a frame stream (list of image bytes).
+
+    Returns (summary dict, [(frame index, mesh bytes)], stage timings). The summary
+    holds the aggregated face shape, or None for it when no frame had a face.
+    Mesh overlays are only rendered for up to VIDEO_MESH_SAMPLES evenly spaced frames.
+    """
+    timings = {}
+    frames = _video_frames(source) if isinstance(source, (bytes, bytearray)) else _image_frames(source)
+    meshes = []
+    with jm.FaceTracker() as tracker, closing(frames):
+        with metrics.timed("video_decode", timings):
+            stride = max(1, next(frames) // max(1, VIDEO_MESH_SAMPLES))
+        for index in range(VIDEO_MAX_FRAMES):
+            with metrics.timed("video_decode", timings):
+                frame = next(frames, None)
+            if frame is None:
+                break
+            with metrics.timed("video_track", timings):
+                points = tracker.process(frame)
+            if points is not None and index % stride == 0 and len(meshes) < VIDEO_MESH_SAMPLES:
+                with metrics.timed("mesh_encode", timings):
+                    meshes.append((index, jm.encode_mesh(jm.render_mesh(frame.copy(), points))))
+
+        summary = {
+            "face_shape": tracker.verdict(),
+            "ratios": None if tracker.ratios is None else [round(float(r), 4) for r in tracker.ratios],
+            "frames": tracker.frames,
+            "frames_with_face": tracker.frames_with_face,
+            "shape_votes": dict(tracker.shape_votes),
+        }
+    return summary, meshes, timings
+
+
+def start(workers: int = MOG_WORKERS, warm_up: bool = True):
+    """Spin up the worker processes, or warm the in-process pool when workers is 0.
+
+    With warm_up=False nothing is loaded yet: workers start (and build their
+    landmarker) when the first job arrives.
+    """
+    global _executor
+    if workers <= 0:
+        if warm_up:
+            jm.get_face_mesh_pool().warm_up()
+        return
+
+    _executor = _new_executor(workers)
+    if not warm_up:
+        return
+    for future in [_executor.submit(_ping) for _ in range(workers)]:
+        future.result()
+
+
+def _new_executor(workers: int) -> ProcessPoolExecutor:
+    # spawn rather than fork: MediaPipe graphs don't survive a fork
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+
+
+def _replace_broken(broken: ProcessPoolExecutor):
+    """Swap in a fresh pool for one whose worker died; only the first caller per pool rebuilds it."""
+    global _executor
+    with _executor_lock:
+        if _executor is not broken:
+            return
+        logger.warning("A worker process died (out of memory or a native crash?); restarting the pool")
+        metrics.WORKER_POOL_RESTARTS.inc()
+        broken.shutdown(wait=False, cancel_futures=True)
+        _executor = _new_executor(broken._max_workers)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+    jm.close_face_mesh_pool()
+
+
+async def run(func, *args):
+    """Run func(*args) on the worker pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    executor = _executor
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        # A broken pool refuses every later job too, so rebuild it and retry this one once
+        _replace_broken(executor)
+        return await loop.run_in_executor(_executor, func, *args)
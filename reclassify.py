@@ -0,0 +1,90 @@
+"""
+Re-score stored jobs from their landmark files, without running FaceMesh.
+
+    python reclassify.py              # print jobs whose face shape changed
+    python reclassify.py --all        # print every job
+    python reclassify.py --write      # also store the new face shapes in the landmark files
+    python reclassify.py --render     # also re-draw mesh-{key} with the current overlay style
+
+Landmark files are listed and downloaded a batch at a time and classified in
+one vectorized classify_face_shapes call per batch. Re-classifying decodes no
+images; --render has to decode each original upload to draw the overlay on it.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import time
+from collections import Counter
+
+import numpy as np
+from PIL import Image
+
+import jawline_math as jm
+from utils import imagePrep, landmarkStore, s3Helper
+
+
+def render(image_bytes: bytes, stored: landmarkStore.StoredLandmarks) -> bytes:
+    image = np.array(imagePrep.normalize(Image.open(io.BytesIO(image_bytes))))
+    return jm.encode_mesh(jm.render_mesh(image, stored.landmarks))
+
+
+async def reclassify_batch(helper, keys, args, changes: Counter) -> int:
+    stored = [landmarkStore.deserialize(data) for data in await helper.download_many(keys)]
+    shapes = jm.classify_face_shapes(
+        np.stack([s.landmarks for s in stored]), [s.image_shape for s in stored]
+    )
+
+    writes = []
+    for key, old, new in zip(keys, stored, shapes):
+        unique_key = landmarkStore.unique_key(key)
+        if old.face_shape != new:
+            changes[f"{old.face_shape} -> {new}"] += 1
+            if args.write:
+                writes.append(helper.upload_bytes(
+                    landmarkStore.serialize(old.landmarks, old.image_shape, new),
+                    key=key, content_type="application/octet-stream",
+                ))
+        if args.all or old.face_shape != new:
+            print(json.dumps({"key": unique_key, "face_shape": new, "previous": old.face_shape}))
+
+    if args.render:
+        originals = await helper.download_many([landmarkStore.unique_key(key) for key in keys])
+        meshes = await asyncio.gather(*[
+            asyncio.to_thread(render, image_bytes, s) for image_bytes, s in zip(originals, stored)
+        ])
+        content_type = jm.MESH_CONTENT_TYPES[jm.MESH_FORMAT]
+        writes.append(helper.upload_many([
+            (mesh, f"mesh-{landmarkStore.unique_key(key)}", content_type) for mesh, key in zip(meshes, keys)
+        ]))
+    await asyncio.gather(*writes)
+    return len(keys)
+
+
+async def main(args):
+    helper = s3Helper.asyncS3Helper()
+    changes = Counter()
+    total = 0
+    started = time.perf_counter()
+    try:
+        async for keys in helper.list_keys(landmarkStore.KEY_PREFIX, page_size=args.batch_size):
+            total += await reclassify_batch(helper, keys, args, changes)
+    finally:
+        helper.close()
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "jobs": total,
+        "changed": sum(changes.values()),
+        "changes": dict(changes),
+        "seconds": round(elapsed, 2),
+    }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="landmark files per listing page and batch")
+    parser.add_argument("--all", action="store_true", help="print unchanged jobs too")
+    parser.add_argument("--write", action="store_true", help="update the stored face shapes")
+    parser.add_argument("--render", action="store_true", help="re-draw and re-upload the mesh overlays")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+import os
+import time
+
+from utils import artifactStore
+from utils.artifactStore import ArtifactStore
+
+
+def files(directory):
+    return sorted(os.path.relpath(os.path.join(root, name), directory)
+                  for root, _, names in os.walk(directory) for name in names)
+
+
+def test_round_trip_in_sharded_namespaces(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    store.put("uploads", "job/1", b"image")
+    store.put("evaluation", "guidance-job.txt", b"text")
+
+    assert store.get("uploads", "job/1") == b"image"
+    assert store.get("evaluation", "guidance-job.txt") == b"text"
+    assert store.get("uploads", "guidance-job.txt") is None
+    # namespace/shard/quoted key, and no temp files left behind
+    namespace, shard, name = files(tmp_path)[1].split(os.sep)
+    assert (namespace, len(shard), name) == ("uploads", 2, "job%2F1")
+    assert len(files(tmp_path)) == 2
+
+
+def test_evicts_least_recently_used_past_max_bytes(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=25)
+    store.put("uploads", "a", b"a" * 10)
+    store.put("uploads", "b", b"b" * 10)
+    store.get("uploads", "a")  # b is now the least recently used
+    store.put("uploads", "c", b"c" * 10)
+
+    assert store.get("uploads", "b") is None
+    assert store.get("uploads", "a") and store.get("uploads", "c")
+    assert store.size == 20 and len(files(tmp_path)) == 2
+
+
+def test_expired_and_outdated_entries_are_misses(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_age=0.05)
+    store.put("evaluation", "old", b"x")
+    store.put("evaluation", "fresh", b"y")
+    assert store.get("evaluation", "fresh", newer_than=time.time() + 1) is None
+
+    time.sleep(0.1)
+    assert store.get("evaluation", "old") is None
+    assert files(tmp_path) == []
+
+
+def test_index_survives_a_restart(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    store.put("uploads", "kept", b"12345")
+    stale = tmp_path / "uploads" / ".stale.tmp"
+    stale.write_bytes(b"half a write")
+    old = time.time() - artifactStore.TMP_GRACE_SECONDS - 1
+    os.utime(stale, (old, old))
+    # Possibly another worker's write in progress
+    fresh = tmp_path / "uploads" / ".fresh.tmp"
+    fresh.write_bytes(b"still writing")
+
+    reopened = ArtifactStore(str(tmp_path))
+    assert stale.exists()  # nothing is walked until first use
+    assert reopened.get("uploads", "kept") == b"12345"
+    assert reopened.size == 5
+    assert not stale.exists() and fresh.exists()
+
+
+def test_writes_sweep_out_expired_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifactStore, "SWEEP_INTERVAL", 0)
+    store = ArtifactStore(str(tmp_path), max_age=0.05)
+    store.put("uploads", "never-read", b"x" * 10)
+    time.sleep(0.1)
+    store.put("uploads", "new", b"y")
+    assert store.size == 1
+    assert files(tmp_path) == [os.path.join("uploads", store._path("uploads", "new").split(os.sep)[-2], "new")]
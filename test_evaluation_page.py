@@ -0,0 +1,61 @@
+import asyncio
+from email.utils import formatdate
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from gemini_evaluator import schema
+
+
+@pytest.fixture
+def client(fake_mog):
+    asyncio.run(api.mog(image="job", prompt="", unique_key="job"))
+    return TestClient(api.app)
+
+
+def test_page_carries_validators(client):
+    response = client.get("/evaluation/job")
+    assert response.status_code == 200
+    assert response.headers["etag"].startswith('"')
+    assert response.headers["last-modified"].endswith("GMT")
+    assert response.headers["cache-control"] == "private, no-cache"
+
+
+def test_matching_etag_is_not_modified(client):
+    etag = client.get("/evaluation/job").headers["etag"]
+    response = client.get("/evaluation/job", headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == 304
+    assert response.content == b"" and response.headers["etag"] == etag
+
+
+def test_if_modified_since_is_not_modified(client):
+    last_modified = client.get("/evaluation/job").headers["last-modified"]
+    assert client.get("/evaluation/job", headers={"If-Modified-Since": last_modified}).status_code == 304
+    earlier = formatdate(api.evaluation_pages["job"].last_modified - 60, usegmt=True)
+    assert client.get("/evaluation/job", headers={"If-Modified-Since": earlier}).status_code == 200
+
+
+def test_stale_etag_gets_the_page(client):
+    response = client.get("/evaluation/job", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200 and response.content
+
+
+def test_rerun_replaces_the_cached_page(client, fake_mog, monkeypatch):
+    s3, _ = fake_mog
+    first = client.get("/evaluation/job")
+
+    async def analyze(image_bytes, lane):
+        analysis = schema.fill_defaults({})
+        analysis["facial_harmony"]["mogger_score"] = 10
+        return analysis
+
+    # A re-upload makes the stored guidance outdated, so /mog analyzes and rewrites it
+    monkeypatch.setattr(api, "analyze_facial_features_async", analyze)
+    asyncio.run(s3.upload_bytes(s3.objects["job"], key="job"))
+    asyncio.run(api.mog(image="job", prompt="", unique_key="job"))
+
+    second = client.get("/evaluation/job", headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 200
+    assert second.headers["etag"] != first.headers["etag"]
+    assert "Mogger Score: 10/10" in second.text and "Mogger Score: 10/10" not in first.text
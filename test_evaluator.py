@@ -0,0 +1,232 @@
+import asyncio
+import io
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+# No API key needed: the evaluator only configures Gemini on first use
+from gemini_evaluator import evaluator, schema
+
+real_configure = evaluator.configure
+
+VALID = schema.fill_defaults({})
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.candidates = []
+
+
+class FakeError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class FakeGemini:
+    """Stands in for genai.GenerativeModel; replays a script of replies/errors."""
+
+    def __init__(self, script=None, latency=0.0):
+        self.script = list(script or [])
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_content_async(self, contents):
+        self.calls += 1
+        self.contents = contents
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            outcome = self.script.pop(0) if self.script else VALID
+            if isinstance(outcome, Exception):
+                raise outcome
+            return FakeResponse(outcome if isinstance(outcome, str) else json.dumps(outcome))
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    uploads = []
+
+    def upload_file(source, mime_type=None):
+        uploads.append(mime_type)
+        return f"file-{len(uploads)}"
+
+    monkeypatch.setattr(evaluator, "configure", lambda: SimpleNamespace(upload_file=upload_file))
+    monkeypatch.setattr(evaluator, "_uploads", {})
+    monkeypatch.setattr(evaluator, "GEMINI_BACKOFF_BASE", 0.001)
+    return uploads
+
+
+def test_retries_rate_limits_and_server_errors():
+    reply = dict(VALID, facial_harmony=dict(VALID["facial_harmony"], mogger_score=10))
+    fake = FakeGemini([FakeError(429), FakeError(503), reply])
+    result = asyncio.run(evaluator.analyze_facial_features_async("Caleb.png", model=fake))
+    assert result == reply
+    assert fake.calls == 3
+
+
+def test_rate_limit_holds_back_queued_calls(monkeypatch):
+    # 600 RPM with a 10s burst: plenty of budget until the 429 drains it
+    monkeypatch.setattr(evaluator, "GEMINI_RPM", 600)
+    monkeypatch.setattr(evaluator, "GEMINI_MAX_CONCURRENCY", 1)
+    fake = FakeGemini([FakeError(429)], latency=0.01)
+
+    async def call(started):
+        await evaluator._call_with_retry(lambda: fake.generate_content_async([]), 1, 0, "default")
+        return time.monotonic() - started
+
+    async def run():
+        started = time.monotonic()
+        limited = asyncio.create_task(call(started))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(call(started))
+        with pytest.raises(FakeError):
+            await limited
+        return await queued
+
+    # Admitted only once a request's worth of budget has refilled, not when the slot frees up
+    assert asyncio.run(run()) > 0.09
+
+
+def test_model_is_built_off_the_event_loop(monkeypatch):
+    built_on = []
+
+    def get_model():
+        built_on.append(threading.current_thread())
+        return FakeGemini()
+
+    monkeypatch.setattr(evaluator, "get_model", get_model)
+    asyncio.run(evaluator.analyze_facial_features_async("Caleb.png"))
+    assert built_on and threading.main_thread() not in built_on
+
+
+def test_does_not_retry_client_errors():
+    fake = FakeGemini([FakeError(400)])
+    with pytest.raises(FakeError):
+        asyncio.run(evaluator.analyze_facial_features_async("Caleb.png", model=fake))
+    assert fake.calls == 1
+
+
+def test_gives_up_after_max_retries():
+    fake = FakeGemini([FakeError(429)] * 5)
+    with pytest.raises(FakeError):
+        asyncio.run(evaluator.analyze_facial_features_async("Caleb.png", model=fake, max_retries=2))
+    assert fake.calls == 3
+
+
+def test_timeout_is_retried():
+    fake = FakeGemini(latency=0.2)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(evaluator.analyze_facial_features_async("Caleb.png", model=fake, timeout=0.01, max_retries=1))
+    assert fake.calls == 2
+
+
+def test_concurrency_is_capped(monkeypatch):
+    monkeypatch.setattr(evaluator, "GEMINI_MAX_CONCURRENCY", 2)
+    fake = FakeGemini(latency=0.02)
+
+    async def burst():
+        return await asyncio.gather(
+            *[evaluator.analyze_facial_features_async("Caleb.png", model=fake) for _ in range(8)]
+        )
+
+    assert asyncio.run(burst()) == [VALID] * 8
+    assert fake.max_in_flight == 2
+
+
+def test_inline_mode_sends_downscaled_jpeg(monkeypatch, offline):
+    monkeypatch.setattr(evaluator, "GEMINI_IMAGE_MODE", "inline")
+    monkeypatch.setattr(evaluator, "GEMINI_INLINE_MAX_EDGE", 256)
+    fake = FakeGemini()
+    with open("SleepyJoe.png", "rb") as file:
+        asyncio.run(evaluator.analyze_facial_features_async(file.read(), model=fake))
+
+    part = fake.contents[1]
+    assert part["mime_type"] == "image/jpeg"
+    assert max(Image.open(io.BytesIO(part["data"])).size) == 256
+    assert offline == []
+
+
+def test_upload_mode_reuses_uploads_by_content(monkeypatch, offline, tmp_path):
+    monkeypatch.setattr(evaluator, "GEMINI_IMAGE_MODE", "upload")
+    copy = tmp_path / "copy.png"
+    copy.write_bytes(open("Caleb.png", "rb").read())
+    fake = FakeGemini()
+
+    for image in ("Caleb.png", str(copy), copy.read_bytes(), "SleepyJoe.png"):
+        asyncio.run(evaluator.analyze_facial_features_async(image, model=fake))
+    # Caleb.png is really a JPEG; the MIME type comes from the bytes, not the name
+    assert offline == ["image/jpeg", "image/png"]
+    assert fake.contents[1] == "file-2"
+
+
+def test_upload_mode_sends_multi_picture_jpegs_as_jpeg(monkeypatch, offline):
+    monkeypatch.setattr(evaluator, "GEMINI_IMAGE_MODE", "upload")
+    frame = Image.new("RGB", (64, 64))
+    buffer = io.BytesIO()
+    frame.save(buffer, "MPO", save_all=True, append_images=[frame])
+
+    asyncio.run(evaluator.analyze_facial_features_async(buffer.getvalue(), model=FakeGemini()))
+    assert offline == ["image/jpeg"]
+
+
+def count(outcome):
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value("gemini_parse_fallbacks_total", {"outcome": outcome}) or 0
+
+
+def test_parse_fallbacks_are_counted():
+    before = count("extracted"), count("unparsed")
+    assert evaluator._extract_json('{"a": 1}') == {"a": 1}
+    assert evaluator._extract_json('Sure! {"a": {"b": 1}} Stay {sigma}.') == {"a": {"b": 1}}
+    assert evaluator._extract_json("no json here") is None
+    assert (count("extracted"), count("unparsed")) == (before[0] + 1, before[1] + 1)
+
+
+def test_invalid_reply_is_repaired_without_the_image():
+    broken = json.loads(json.dumps(VALID))
+    del broken["skin_quality"]["zyzz_score"]
+    broken["cheekbones"]["suggestions"] = ["only one"]
+    broken["nose_structure"]["mog_score"] = 42
+    before = count("repaired")
+    fake = FakeGemini([broken, VALID])
+
+    result = asyncio.run(evaluator.analyze_facial_features_async("Caleb.png", model=fake))
+    assert result == VALID
+    assert fake.calls == 2
+    # The re-ask is one text prompt naming what was wrong; out-of-range scores are just clamped
+    (prompt,) = fake.contents
+    assert "skin_quality.zyzz_score" in prompt and "cheekbones.suggestions" in prompt
+    assert "mog_score" not in prompt.split("Previous reply:")[0]
+    assert count("repaired") == before + 1
+
+
+def test_unrepairable_reply_falls_back_to_placeholders():
+    partial = {"jawline_enhancement": dict(VALID["jawline_enhancement"], current_definition="Chiselled")}
+    fake = FakeGemini(["not json", partial])
+
+    with pytest.raises(evaluator.IncompleteAnalysis) as e:
+        asyncio.run(evaluator.analyze_facial_features_async("Caleb.png", model=fake))
+    assert fake.calls == 1 + evaluator.GEMINI_REPAIR_ATTEMPTS
+    # Whatever was usable is kept and the rest is filled in, so the report always renders
+    assert e.value.analysis["jawline_enhancement"]["current_definition"] == "Chiselled"
+    assert schema.validate(e.value.analysis) == []
+
+
+def test_missing_key_fails_on_first_use_not_import(monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    monkeypatch.setattr(evaluator, "load_dotenv", lambda: None)
+    monkeypatch.setattr(evaluator, "_genai", None)
+    with pytest.raises(ValueError):
+        real_configure()
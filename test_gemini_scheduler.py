@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+from gemini_evaluator.scheduler import GeminiScheduler
+
+
+def test_deliveries_go_before_queued_default_calls():
+    order = []
+
+    async def call(limiter, lane, name):
+        async with limiter.slot(lane):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        limiter = GeminiScheduler(max_concurrency=1)
+        first = asyncio.create_task(call(limiter, "default", "running"))
+        await asyncio.sleep(0)
+        # Queued in arrival order while the only slot is busy
+        rest = [
+            asyncio.create_task(call(limiter, lane, name))
+            for lane, name in [("default", "d1"), ("delivery", "p1"), ("default", "d2"), ("delivery", "p2")]
+        ]
+        await asyncio.gather(first, *rest)
+
+    asyncio.run(run())
+    assert order == ["running", "p1", "p2", "d1", "d2"]
+
+
+def test_request_budget_paces_calls_evenly():
+    async def run():
+        # 600 RPM with a 0.1s burst: one call up front, then one every 0.1s
+        limiter = GeminiScheduler(rpm=600, max_concurrency=10, burst_seconds=0.1)
+        started = time.monotonic()
+        granted = []
+
+        async def call():
+            async with limiter.slot():
+                granted.append(time.monotonic() - started)
+
+        await asyncio.gather(*[call() for _ in range(4)])
+        return granted
+
+    granted = asyncio.run(run())
+    assert granted[0] < 0.05
+    assert 0.25 < granted[-1] < 0.45
+
+
+def test_token_budget_is_corrected_from_usage():
+    async def run():
+        limiter = GeminiScheduler(tpm=60_000, max_concurrency=10, burst_seconds=1)  # 1000 tokens/s
+        async with limiter.slot(tokens=100) as grant:
+            grant.tokens = 1000  # the reply used far more than estimated
+        started = time.monotonic()
+        async with limiter.slot(tokens=100):
+            return time.monotonic() - started
+
+    # The overrun has to be paid back before the next call is admitted
+    assert 0.05 < asyncio.run(run()) < 0.3
+
+
+def test_throttling_holds_back_new_calls():
+    async def run():
+        limiter = GeminiScheduler(rpm=600, max_concurrency=10, burst_seconds=10)
+        async with limiter.slot():
+            pass
+        limiter.throttled()
+        started = time.monotonic()
+        async with limiter.slot():
+            return time.monotonic() - started
+
+    assert 0.05 < asyncio.run(run()) < 0.3
+
+
+def test_cancelled_waiters_do_not_hold_slots():
+    async def run():
+        limiter = GeminiScheduler(max_concurrency=1)
+        async with limiter.slot():
+            waiter = asyncio.create_task(limiter.slot().__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+        async with limiter.slot():
+            return True
+
+    assert asyncio.run(asyncio.wait_for(run(), 1))
@@ -0,0 +1,169 @@
+import io
+import threading
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+import jawline_math as jm
+
+
+def test_pool_reuses_instances():
+    pool = jm.FaceMeshPool(size=1)
+    with pool.acquire() as first:
+        pass
+    with pool.acquire() as second:
+        pass
+    assert first is second
+    pool.close()
+
+
+def test_pool_is_bounded():
+    pool = jm.FaceMeshPool(size=2)
+    seen = set()
+    barrier = threading.Barrier(4)
+
+    def borrow():
+        barrier.wait()
+        with pool.acquire(timeout=30) as face_mesh:
+            seen.add(id(face_mesh))
+
+    threads = [threading.Thread(target=borrow) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(seen) <= 2
+    pool.close()
+
+
+def test_draw_face_landmarks_with_pool():
+    pool = jm.FaceMeshPool(size=1)
+    image = Image.open("Caleb.png")
+    output_image, landmarks = jm.draw_face_landmarks(image, pool=pool)
+    assert output_image is not None
+    assert len(landmarks) == 478
+    assert jm.classify_face_shape(landmarks, image.size[::-1]) in {"Long", "Round", "Oval", "Square"}
+    pool.close()
+
+
+def test_classify_face_shape_matches_per_point_math():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        points = rng.uniform(0, 1, (478, 3)).astype(np.float32)
+        image_shape = tuple(int(v) for v in rng.integers(100, 4000, 2))
+        landmarks = [SimpleNamespace(x=float(x), y=float(y), z=float(z)) for x, y, z in points]
+
+        jaw_width = jm.distance(landmarks[0], landmarks[16], image_shape)
+        cheekbone_width = jm.distance(landmarks[234], landmarks[454], image_shape)
+        face_height = jm.distance(landmarks[10], landmarks[152], image_shape)
+        ratio1, ratio2 = jm.face_ratios(points, image_shape)
+
+        assert ratio1 == pytest.approx(face_height / cheekbone_width)
+        assert ratio2 == pytest.approx(cheekbone_width / jaw_width)
+        assert jm.classify_face_shape(landmarks, image_shape) == jm.classify_face_shape(points, image_shape)
+
+
+def test_classify_face_shapes_batch():
+    rng = np.random.default_rng(1)
+    batch = rng.uniform(0, 1, (64, 478, 3)).astype(np.float32)
+    shapes = rng.integers(100, 4000, (64, 2))
+    expected = [jm.classify_face_shape(points, shape) for points, shape in zip(batch, shapes)]
+    assert jm.classify_face_shapes(batch, shapes) == expected
+    assert jm.classify_face_shapes(batch, (720, 1280)) == [
+        jm.classify_face_shape(points, (720, 1280)) for points in batch
+    ]
+    assert jm.classify_face_shapes(np.empty((0, 478, 3)), (720, 1280)) == []
+
+
+def test_downscaled_detection_maps_back_to_full_resolution():
+    pool = jm.FaceMeshPool(size=1)
+    image = Image.open("Caleb.png").convert("RGB")
+    large = image.resize((image.width * 4, image.height * 4))
+
+    _, full = jm.draw_face_landmarks(image, pool=pool, max_edge=0)
+    output_image, scaled = jm.draw_face_landmarks(large, pool=pool, max_edge=600)
+    assert output_image.shape[:2] == (large.height, large.width)
+    # Normalized landmarks agree to within a couple of pixels of the original image
+    assert np.abs(full[:, :2] - scaled[:, :2]).max() < 3 / image.width
+    pool.close()
+
+
+def test_exif_orientation_is_applied():
+    pool = jm.FaceMeshPool(size=1)
+    image = Image.open("Caleb.png").convert("RGB")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # stored rotated, display needs a 90 degree turn
+    buffer = io.BytesIO()
+    image.rotate(90, expand=True).save(buffer, format="JPEG", exif=exif)
+
+    output_image, landmarks = jm.draw_face_landmarks(Image.open(buffer), pool=pool)
+    assert output_image.shape[:2] == (image.height, image.width)
+    assert landmarks is not None
+    pool.close()
+
+
+def test_tessellation_matches_drawing_utils():
+    import mediapipe as mp
+    from mediapipe.framework.formats import landmark_pb2
+
+    image = np.array(Image.open("SleepyJoe.png").convert("RGB"))
+    _, points = jm.draw_face_landmarks(Image.fromarray(image), pool=jm.FaceMeshPool(size=1))
+    # A face partly out of frame: edges touching a point outside [0, 1] are skipped,
+    # and points exactly on the right/bottom edge are clamped to the last pixel
+    shifted = points.copy()
+    shifted[:, 0] += 1 - shifted[:, 0].max() + 0.02
+    shifted[0, :2] = 1.0
+    shifted[1, 1] = -0.01
+
+    for landmarks in (points, shifted):
+        landmark_list = landmark_pb2.NormalizedLandmarkList(landmark=[
+            landmark_pb2.NormalizedLandmark(x=float(x), y=float(y), z=float(z)) for x, y, z in landmarks
+        ])
+        expected = image.copy()
+        mp.solutions.drawing_utils.draw_landmarks(
+            image=expected,
+            landmark_list=landmark_list,
+            connections=mp.solutions.face_mesh.FACEMESH_TESSELATION,
+            landmark_drawing_spec=None,
+            connection_drawing_spec=mp.solutions.drawing_utils.DrawingSpec(thickness=1, circle_radius=1))
+        actual = image.copy()
+        jm.draw_tessellation(actual, landmarks)
+        np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("fmt", ["png", "jpeg", "webp"])
+def test_encode_mesh(fmt):
+    image = np.array(Image.open("Caleb.png").convert("RGB"))
+    encoded = jm.encode_mesh(image, fmt=fmt, quality=80)
+    decoded = Image.open(io.BytesIO(encoded))
+    assert decoded.format == fmt.upper()
+    assert decoded.size == (image.shape[1], image.shape[0])
+
+
+def test_track_video_agrees_with_static_classification(tmp_path):
+    import pipeline
+
+    image = np.array(Image.open("Caleb.png").convert("RGB"))
+    _, points = jm.draw_face_landmarks(Image.fromarray(image), pool=jm.FaceMeshPool(size=1))
+    expected = jm.classify_face_shape(points, image.shape[:2])
+
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 15, (image.shape[1], image.shape[0]))
+    for i in range(12):
+        # Small horizontal jitter, like a hand-held camera
+        writer.write(cv2.cvtColor(np.roll(image, i % 4, axis=1), cv2.COLOR_RGB2BGR))
+    writer.release()
+
+    summary, meshes, timings = pipeline.track_video(open(path, "rb").read())
+    assert summary["face_shape"] == expected
+    assert summary["frames"] == summary["frames_with_face"] == 12
+    assert [index for index, _ in meshes] == [0, 3, 6, 9]
+    assert set(timings) == {"video_decode", "video_track", "mesh_encode"}
+
+    frames = [open("Caleb.png", "rb").read()] * 3
+    summary, meshes, _ = pipeline.track_video(frames)
+    assert summary["face_shape"] == expected
+    assert len(meshes) == 3
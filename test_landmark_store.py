@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import jawline_math as jm
+from utils import landmarkStore
+
+
+@pytest.fixture(scope="module")
+def detected():
+    pool = jm.FaceMeshPool(size=1)
+    faces = []
+    for name in ("Caleb.png", "SleepyJoe.png"):
+        output_image, points = jm.draw_face_landmarks(Image.open(name), pool=pool)
+        faces.append((points, output_image.shape[:2]))
+    pool.close()
+    return faces
+
+
+def test_round_trip_is_compact(detected):
+    points, image_shape = detected[0]
+    data = landmarkStore.serialize(points, image_shape, "Square")
+    assert len(data) < 4096
+
+    stored = landmarkStore.deserialize(data)
+    assert stored.image_shape == tuple(image_shape)
+    assert stored.face_shape == "Square"
+    assert stored.landmarks.dtype == np.float32
+    np.testing.assert_allclose(stored.landmarks, points, atol=1e-3)
+
+
+def test_float16_landmarks_classify_like_the_originals(detected):
+    stored = [landmarkStore.deserialize(landmarkStore.serialize(p, s, "")) for p, s in detected]
+    shapes = jm.classify_face_shapes(np.stack([s.landmarks for s in stored]), [s.image_shape for s in stored])
+    assert shapes == [jm.classify_face_shape(p, s) for p, s in detected]
+
+
+def test_keys():
+    key = landmarkStore.landmarks_key("job-1")
+    assert key == "landmarks-job-1.npz"
+    assert landmarkStore.unique_key(key) == "job-1"
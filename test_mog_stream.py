@@ -0,0 +1,55 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+
+
+def events(response):
+    """(event, data) pairs from a text/event-stream body."""
+    parsed = []
+    for block in response.text.split("\n\n"):
+        if block:
+            event, data = block.split("\n")
+            assert event.startswith("event: ") and data.startswith("data: ")
+            parsed.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return parsed
+
+
+@pytest.fixture
+def client(fake_mog):
+    return TestClient(api.app)
+
+
+def stream(client, image):
+    response = client.get("/mog/stream", params={"image": image, "prompt": "", "unique_key": image})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.endswith("\n\n")
+    return events(response)
+
+
+def test_stages_arrive_in_order(client):
+    received = stream(client, "job")
+    names = [name for name, _ in received]
+    assert names[:2] == ["downloaded", "landmarks"] and names[-1] == "report"
+    # The mesh and the Gemini sections land in whichever order they finish
+    assert set(names[2:-1]) == {"mesh", "analysis"} and names.count("mesh") == 1
+    assert received[1][1]["face_shape"] == "Round"
+    assert received[-1][1]["mesh_key"] == "mesh-job"
+
+
+def test_missing_image_ends_with_an_error(client):
+    assert stream(client, "nobody") == [("error", {"error": "Image nobody not found"})]
+
+
+def test_no_face_ends_with_an_error(client, monkeypatch):
+    async def no_face(func, image_bytes):
+        return None, None, None, {}
+
+    monkeypatch.setattr(api.pipeline, "run", no_face)
+    assert stream(client, "job") == [
+        ("downloaded", {"bytes": len(api.async_s3.objects["job"])}),
+        ("error", {"error": "Could not detect face landmarks", "landmarks_detected": False}),
+    ]
@@ -0,0 +1,40 @@
+import asyncio
+import os
+
+import pytest
+
+import pipeline
+
+
+def crash_once(marker):
+    """Kill the worker process the first time, like an OOM on one oversized upload."""
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return os.getpid()
+
+
+@pytest.fixture
+def worker_pool():
+    pipeline.start(workers=1, warm_up=False)
+    yield
+    pipeline.shutdown()
+
+
+def test_job_is_retried_on_a_fresh_pool_after_a_worker_dies(worker_pool, tmp_path):
+    async def run():
+        first = await pipeline.run(pipeline._ping)
+        retried = await pipeline.run(crash_once, str(tmp_path / "crashed"))
+        return first, retried, await pipeline.run(pipeline._ping)
+
+    first, retried, after = asyncio.run(run())
+    assert retried != first and after == retried
+
+
+def test_a_job_that_keeps_crashing_fails_but_the_pool_recovers(worker_pool):
+    async def run():
+        with pytest.raises(pipeline.BrokenProcessPool):
+            await pipeline.run(os._exit, 1)
+        return await pipeline.run(pipeline._ping)
+
+    assert asyncio.run(run())
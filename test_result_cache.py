@@ -0,0 +1,62 @@
+import numpy as np
+
+from utils import resultCache
+
+
+def _result(mesh_size=1000):
+    return resultCache.CachedResult(
+        face_shape="Oval",
+        landmarks=np.random.default_rng(0).uniform(0, 1, (478, 3)).astype(np.float32),
+        analysis={"facial_harmony": {"mogger_score": 9}},
+        mesh=b"\x89PNG" + bytes(mesh_size),
+    )
+
+
+def test_cache_key_depends_on_model_and_prompt():
+    key = resultCache.cache_key(b"image", "gemini-2.0-flash", "1")
+    assert key == resultCache.cache_key(b"image", "gemini-2.0-flash", "1")
+    assert key != resultCache.cache_key(b"image", "gemini-2.0-flash", "2")
+    assert key != resultCache.cache_key(b"image", "gemini-1.5-flash", "1")
+    assert key != resultCache.cache_key(b"other", "gemini-2.0-flash", "1")
+
+
+def test_disk_tier_survives_new_process(tmp_path):
+    result = _result()
+    resultCache.ResultCache(directory=str(tmp_path)).put("abc", result)
+
+    cached = resultCache.ResultCache(directory=str(tmp_path)).get("abc")
+    assert cached.face_shape == "Oval"
+    assert cached.analysis == result.analysis
+    assert cached.mesh == result.mesh
+    assert cached.mesh_content_type == "image/png"
+    np.testing.assert_array_equal(cached.landmarks, result.landmarks)
+
+
+def test_memory_tier_is_lru(tmp_path):
+    cache = resultCache.ResultCache(directory=str(tmp_path), max_items=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, _result())
+    assert list(cache._memory) == ["b", "c"]
+
+
+def test_disk_tier_evicts_by_size(tmp_path):
+    cache = resultCache.ResultCache(directory=str(tmp_path), max_bytes=50_000)
+    for i in range(10):
+        cache.put(f"key{i}", _result(mesh_size=10_000))
+    on_disk = sorted(p.stem for p in tmp_path.glob("*.npz"))
+    assert sum(p.stat().st_size for p in tmp_path.glob("*.npz")) <= 50_000
+    assert "key9" in on_disk and "key0" not in on_disk
+
+
+def test_directory_is_only_scanned_on_load_or_first_write(tmp_path):
+    resultCache.ResultCache(directory=str(tmp_path)).put("abc", _result())
+    size = (tmp_path / "abc.npz").stat().st_size
+
+    missing = tmp_path / "missing"
+    cache = resultCache.ResultCache(directory=str(missing))
+    assert not missing.exists() and cache.get("abc") is None
+
+    reopened = resultCache.ResultCache(directory=str(tmp_path))
+    assert reopened._disk_bytes == 0
+    reopened.load()
+    assert reopened._disk_bytes == size
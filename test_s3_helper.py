@@ -0,0 +1,97 @@
+import asyncio
+import os
+import threading
+
+import pytest
+import requests
+
+from utils import s3Helper
+
+
+@pytest.fixture
+def helper(s3):
+    helper = s3Helper.asyncS3Helper(client=s3, multipart_threshold=5 * 1024 * 1024)
+    yield helper
+    helper.close()
+
+
+def test_round_trip_and_presigned_url(helper, prefix):
+    async def run():
+        url = await helper.upload_bytes(b"mesh", f"{prefix}mesh-abc")
+        return url, await helper.download_bytes(f"{prefix}mesh-abc")
+
+    url, data = asyncio.run(run())
+    assert data == b"mesh"
+    assert requests.get(url).content == b"mesh"
+
+
+def test_parallel_transfers(helper, prefix):
+    objects = [(f"body-{i}".encode(), f"{prefix}key-{i}", "text/plain") for i in range(8)]
+
+    async def run():
+        await helper.upload_many(objects)
+        return await helper.download_many([key for _, key, _ in objects])
+
+    assert asyncio.run(run()) == [data for data, _, _ in objects]
+
+
+def test_large_upload_is_multipart(helper, prefix):
+    data = os.urandom(11 * 1024 * 1024)
+    asyncio.run(helper.upload_bytes(data, f"{prefix}big.png"))
+
+    head = helper.s3.head_object(Bucket=helper.BUCKET_NAME, Key=f"{prefix}big.png")
+    # Multipart ETags end in -<part count>
+    assert head["ETag"].strip('"').endswith("-3")
+    assert asyncio.run(helper.download_bytes(f"{prefix}big.png")) == data
+
+
+def test_upload_text(helper, prefix):
+    # upload_text names the object guidance-{key}.txt, so the prefix goes after that
+    asyncio.run(helper.upload_text("sigma", unique_key=f"{prefix}k1"))
+    body = helper.s3.get_object(Bucket=helper.BUCKET_NAME, Key=f"guidance-{prefix}k1.txt")
+    assert body["ContentType"].startswith("text/plain")
+    assert body["Body"].read() == b"sigma"
+
+
+def test_list_keys_pages(helper, prefix):
+    objects = [(b"x", f"{prefix}listed-{i}", "text/plain") for i in range(5)]
+
+    async def run():
+        await helper.upload_many(objects)
+        return [keys async for keys in helper.list_keys(prefix, page_size=2)]
+
+    pages = asyncio.run(run())
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sorted(sum(pages, [])) == [key for _, key, _ in objects]
+
+
+def test_head(helper, prefix):
+    async def run():
+        await helper.upload_bytes(b"abc", f"{prefix}headed", content_type="text/plain")
+        return await helper.head(f"{prefix}headed"), await helper.head(f"{prefix}not-there")
+
+    found, missing = asyncio.run(run())
+    assert found["ContentLength"] == 3 and "LastModified" in found
+    assert missing is None
+
+
+def test_client_is_built_off_the_event_loop(s3, prefix, monkeypatch):
+    built_on = []
+
+    def build(**config):
+        built_on.append(threading.current_thread())
+        return s3
+
+    monkeypatch.setattr(s3Helper, "_client", build)
+
+    async def run():
+        for first_call in ("upload", "presign"):
+            helper = s3Helper.asyncS3Helper()
+            if first_call == "upload":
+                await helper.upload_bytes(b"mesh", f"{prefix}mesh-lazy")
+            else:
+                await helper.presign(f"{prefix}mesh-lazy")
+            helper.close()
+
+    asyncio.run(run())
+    assert len(built_on) == 2 and threading.main_thread() not in built_on
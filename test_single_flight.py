@@ -0,0 +1,103 @@
+import asyncio
+
+import api
+from utils.singleFlight import SingleFlight
+
+
+def test_concurrent_followers_share_one_run():
+    starts = []
+
+    async def events(name):
+        starts.append(name)
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield i
+
+    async def collect(flights, name):
+        return [event async for event in flights.follow("key", lambda: events(name))]
+
+    async def run():
+        flights = SingleFlight()
+        first = asyncio.create_task(collect(flights, "first"))
+        await asyncio.sleep(0.015)  # join after the first event
+        second = await collect(flights, "second")
+        assert "key" not in flights
+        # The key is free again, so this starts a new run
+        third = await collect(flights, "third")
+        return await first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first == second == third == [0, 1, 2]
+    assert starts == ["first", "third"]
+
+
+def test_duplicate_requests_for_a_key_run_once(fake_mog):
+    s3, calls = fake_mog
+
+    async def burst():
+        return await asyncio.gather(*[api.mog(image="job", prompt="", unique_key="job") for _ in range(3)])
+
+    results = asyncio.run(burst())
+    assert results[0] == results[1] == results[2]
+    assert "formatted_response" in results[0]
+    assert calls == {"pipeline": 1, "gemini": 1}
+
+
+def test_same_image_under_another_key_waits_for_the_running_analysis(fake_mog):
+    s3, calls = fake_mog
+
+    async def burst():
+        return await asyncio.gather(
+            api.mog(image="job", prompt="", unique_key="job"),
+            api.mog(image="other-job", prompt="", unique_key="other-job"),
+        )
+
+    first, second = asyncio.run(burst())
+    assert first["formatted_response"] == second["formatted_response"]
+    assert calls == {"pipeline": 1, "gemini": 1}
+    # Each key still gets its own artifacts
+    assert {"guidance-job.txt", "guidance-other-job.txt", "mesh-job", "mesh-other-job"} <= set(s3.objects)
+
+
+def test_finished_job_is_served_from_stored_guidance(fake_mog):
+    s3, calls = fake_mog
+    first = asyncio.run(api.mog(image="job", prompt="", unique_key="job"))
+    again = asyncio.run(api.mog(image="job", prompt="", unique_key="job"))
+    assert again == first
+    assert calls == {"pipeline": 1, "gemini": 1}
+
+    # A re-upload under the same key is newer than the guidance, so it is analyzed again
+    asyncio.run(s3.upload_bytes(s3.objects["job"], key="job"))
+    asyncio.run(api.mog(image="job", prompt="", unique_key="job"))
+    assert calls == {"pipeline": 2, "gemini": 2}
+
+
+def test_artifacts_are_read_locally_until_s3_has_something_newer(fake_mog):
+    s3, calls = fake_mog
+    asyncio.run(api.mog(image="job", prompt="", unique_key="job"))
+    assert api.artifacts.get("uploads", "job") == s3.objects["job"]
+    assert api.artifacts.get("evaluation", "guidance-job.txt") == s3.objects["guidance-job.txt"]
+
+    # The stored report comes from the local copy, not S3
+    s3.objects["guidance-job.txt"] = b"only in S3"
+    assert asyncio.run(api.mog(image="job", prompt="", unique_key="job"))["formatted_response"] != "only in S3"
+
+    # A newer object in S3 replaces the local copy
+    asyncio.run(s3.upload_bytes(b"rewritten", key="guidance-job.txt"))
+    assert asyncio.run(api.mog(image="job", prompt="", unique_key="job"))["formatted_response"] == "rewritten"
+
+
+def test_failed_local_writes_do_not_fail_requests(fake_mog, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    s3, calls = fake_mog
+
+    def disk_full(namespace, key, data):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(api.artifacts, "put", disk_full)
+    result = asyncio.run(api.mog(image="job", prompt="", unique_key="job"))
+    assert "formatted_response" in result and s3.objects["guidance-job.txt"]
+
+    response = TestClient(api.app).get("/evaluation/job")
+    assert response.status_code == 200
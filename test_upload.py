@@ -0,0 +1,129 @@
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from utils import s3Helper, uploadStream
+
+
+@pytest.fixture
+def client(s3, monkeypatch):
+    helper = s3Helper.asyncS3Helper(client=s3, multipart_threshold=5 * 1024 * 1024)
+    monkeypatch.setattr(api, "async_s3", helper)
+    # No lifespan: /upload needs neither the worker pool nor Gemini
+    yield TestClient(api.app)
+    helper.close()
+
+
+def keys(s3, prefix):
+    listing = s3.list_objects_v2(Bucket=s3Helper.asyncS3Helper.BUCKET_NAME, Prefix=prefix)
+    return sorted(item["Key"] for item in listing.get("Contents", []))
+
+
+def head(s3, key):
+    return s3.head_object(Bucket=s3Helper.asyncS3Helper.BUCKET_NAME, Key=key)
+
+
+def test_small_upload_goes_up_in_one_put(client, s3, prefix):
+    data = open("SleepyJoe.png", "rb").read()
+    response = client.post(
+        "/upload", data={"key": f"{prefix}small", "prompt": "mog me"}, files={"image": ("a.png", data, "image/png")}
+    )
+    assert response.json()["error"] is False
+    stored = head(s3, f"{prefix}small")
+    assert stored["ContentType"] == "image/png"
+    assert stored["Metadata"]["prompt"] == "mog me"
+    assert "-" not in stored["ETag"]
+
+
+def test_large_upload_streams_as_multipart(client, s3, prefix):
+    # A valid header followed by padding: only the first bytes are ever parsed
+    data = open("Caleb.png", "rb").read() + bytes(11 * 1024 * 1024)
+    response = client.post(
+        "/upload", data={"key": f"{prefix}large", "prompt": ""}, files={"image": ("a.jpg", data, "image/jpeg")}
+    )
+    assert response.json()["error"] is False
+    stored = head(s3, f"{prefix}large")
+    # Caleb.png is a JPEG; the stored type comes from the bytes, not the client
+    assert stored["ContentType"] == "image/jpeg"
+    assert stored["ETag"].strip('"').endswith("-3")
+    body = s3.get_object(Bucket=s3Helper.asyncS3Helper.BUCKET_NAME, Key=f"{prefix}large")["Body"].read()
+    assert body == data
+
+
+def test_rejects_non_images_without_storing(client, s3, prefix):
+    response = client.post(
+        "/upload", data={"key": f"{prefix}junk", "prompt": ""},
+        files={"image": ("a.png", b"not an image" * 100, "image/png")},
+    )
+    assert response.status_code == 415
+    assert keys(s3, prefix) == []
+
+
+def test_rejects_oversized_uploads(client, s3, prefix, monkeypatch):
+    monkeypatch.setattr(uploadStream, "UPLOAD_MAX_BYTES", 1024)
+    data = open("SleepyJoe.png", "rb").read()
+    response = client.post(
+        "/upload", data={"key": f"{prefix}big", "prompt": ""}, files={"image": ("a.png", data, "image/png")}
+    )
+    assert response.status_code == 413
+    assert keys(s3, prefix) == []
+
+
+def test_image_before_key_is_staged_then_moved(client, s3, prefix):
+    data = open("SleepyJoe.png", "rb").read()
+    boundary = "sigmaboundary"
+    body = io.BytesIO()
+    body.write(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="a.png"\r\n'
+        f"Content-Type: image/png\r\n\r\n".encode()
+    )
+    body.write(data)
+    for name, value in (("key", f"{prefix}late-key"), ("prompt", "late prompt")):
+        body.write(f'\r\n--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}'.encode())
+    body.write(f"\r\n--{boundary}--\r\n".encode())
+
+    response = client.post(
+        "/upload", content=body.getvalue(), headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    assert response.json()["error"] is False
+    assert head(s3, f"{prefix}late-key")["Metadata"]["prompt"] == "late prompt"
+    assert keys(s3, prefix) == [f"{prefix}late-key"]
+    assert keys(s3, "incoming/") == []
+
+
+def test_size_cap_is_enforced_while_streaming():
+    import asyncio
+
+    async def form():
+        yield ("data", open("SleepyJoe.png", "rb").read(2048))
+        while True:
+            yield ("data", bytes(1024))
+
+    async def run():
+        stream = uploadStream.ImageStream(form(), max_bytes=8192)
+        await stream.sniff()
+        return [len(chunk) async for chunk in stream]
+
+    with pytest.raises(uploadStream.UploadRejected) as rejected:
+        asyncio.run(run())
+    assert rejected.value.status_code == 413
+
+
+def test_multi_picture_jpegs_are_typed_as_jpeg():
+    import asyncio
+
+    from PIL import Image
+
+    frame = Image.new("RGB", (64, 64))
+    buffer = io.BytesIO()
+    frame.save(buffer, "MPO", save_all=True, append_images=[frame])
+
+    async def form():
+        yield ("data", buffer.getvalue())
+        yield ("end",)
+
+    stream = uploadStream.ImageStream(form())
+    asyncio.run(stream.sniff())
+    assert (stream.format, stream.content_type) == ("MPO", "image/jpeg")
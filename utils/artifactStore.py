@@ -0,0 +1,161 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import quote
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", 1024 * 1024 * 1024))
+ARTIFACT_MAX_AGE = float(os.getenv("ARTIFACT_MAX_AGE", 24 * 60 * 60))  # seconds since written
+# Temp files younger than this may be another worker's write in progress
+TMP_GRACE_SECONDS = 10 * 60
+# Longest gap between sweeps for expired entries, so the age limit bounds disk use too
+SWEEP_INTERVAL = 60
+
+
+class ArtifactStore:
+    """Bounded local copies of job artifacts, kept as a read-through cache in front of S3.
+
+    Files live under {directory}/{namespace}/{shard}/{key}, with the shard taken
+    from a hash of the key so no directory grows past a few hundred entries.
+    Writes go to a temp file and are renamed into place, so readers never see a
+    partial file. Expired entries (older than max_age) miss when read and are
+    swept out as writes come in; past max_bytes, least recently used entries
+    are evicted too.
+
+    The index of what is on disk is built by load(), from api.startup() or on
+    first use, so importing the module never walks the store.
+    """
+
+    def __init__(self, directory: str = ARTIFACT_DIR, max_bytes: int = ARTIFACT_MAX_BYTES,
+                 max_age: float = ARTIFACT_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # path -> (size, written at), least recently used first
+        self._index: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._next_sweep = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self):
+        """Index the files already on disk; cheap once done."""
+        with self._lock:
+            self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        # Caller holds the lock
+        if self._loaded:
+            return
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                    if name.endswith(".tmp"):
+                        if now - stat.st_mtime > TMP_GRACE_SECONDS:
+                            # Left behind by a write that never finished
+                            os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue  # renamed or removed by another worker meanwhile
+                entries.append((stat.st_atime, path, stat.st_size, stat.st_mtime))
+        # Access times (where the filesystem keeps them) give the LRU order across restarts
+        for _, path, size, written in sorted(entries):
+            if path not in self._index:
+                self._index[path] = (size, written)
+                self._bytes += size
+        self._loaded = True
+
+    def _path(self, namespace: str, key: str) -> str:
+        shard = hashlib.sha1(key.encode("utf-8")).hexdigest()[:2]
+        return os.path.join(self.directory, namespace, shard, quote(key, safe=""))
+
+    def get(self, namespace: str, key: str, newer_than: float = 0.0) -> Optional[bytes]:
+        """The stored bytes, or None if missing, expired or written before newer_than (a timestamp)."""
+        path = self._path(namespace, key)
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._index.get(path)
+            if entry is None:
+                return None
+            written = entry[1]
+            if written < newer_than or time.time() - written > self.max_age:
+                self._remove(path)
+                return None
+            self._index.move_to_end(path)
+        try:
+            with open(path, "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(path)
+            return None
+
+    def put(self, namespace: str, key: str, data: bytes):
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            with self._lock:
+                self._ensure_loaded()
+                os.replace(tmp_path, path)
+                self._forget(path)
+                now = time.time()
+                self._index[path] = (len(data), now)
+                self._bytes += len(data)
+                if now >= self._next_sweep:
+                    self._sweep(now)
+                self._evict()
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._ensure_loaded()
+            self._remove(self._path(namespace, key))
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    def _forget(self, path: str):
+        # Caller holds the lock
+        entry = self._index.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry[0]
+
+    def _remove(self, path: str):
+        # Caller holds the lock
+        self._forget(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _sweep(self, now: float):
+        # Caller holds the lock
+        for path in [path for path, (_, written) in self._index.items() if now - written > self.max_age]:
+            self._remove(path)
+        self._next_sweep = now + min(SWEEP_INTERVAL, self.max_age)
+
+    def _evict(self):
+        # Caller holds the lock. Expired entries go first, then least recently used ones
+        if self._bytes <= self.max_bytes:
+            return
+        self._sweep(time.time())
+        while self._bytes > self.max_bytes and self._index:
+            self._remove(next(iter(self._index)))
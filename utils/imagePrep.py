@@ -0,0 +1,62 @@
+import io
+import os
+
+from PIL import Image, ImageOps
+
+# Longest edge FaceMesh sees; 0 disables downscaling. The overlay is still drawn at full size.
+LANDMARK_MAX_EDGE = int(os.getenv("LANDMARK_MAX_EDGE", 1280))
+
+EXIF_ORIENTATION = 0x0112
+# Pillow reports multi-picture JPEGs (most phone cameras) as MPO, but they are served and accepted as JPEG
+MIME_OVERRIDES = {"MPO": "image/jpeg"}
+
+
+def mime_type(image_format, default: str) -> str:
+    """MIME type for a Pillow format name, or default if it has none."""
+    return MIME_OVERRIDES.get(image_format) or Image.MIME.get(image_format, default)
+
+
+def normalize(image: Image.Image) -> Image.Image:
+    """Apply the EXIF orientation and convert to RGB, without copying when neither is needed."""
+    if image.getexif().get(EXIF_ORIENTATION, 1) != 1:
+        image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def oriented_size(image: Image.Image):
+    """(h, w) the image will have after normalize(), read from the header without decoding."""
+    width, height = image.size
+    # Orientations 5-8 rotate by 90 degrees
+    if image.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+        width, height = height, width
+    return height, width
+
+
+def downscale(image: Image.Image, max_edge: int) -> Image.Image:
+    """Shrink image so its longest edge is at most max_edge; small images are returned as-is."""
+    width, height = image.size
+    if max_edge <= 0 or max(width, height) <= max_edge:
+        return image
+    scale = max_edge / max(width, height)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+def open_image(path, max_edge: int = 0) -> Image.Image:
+    """Open a path or file object as a normalized RGB image, optionally downscaled.
+
+    With max_edge set, JPEGs are decoded directly at a reduced scale so the
+    full-resolution bitmap is never allocated.
+    """
+    image = Image.open(path)
+    if max_edge > 0:
+        image.draft("RGB", (max_edge, max_edge))
+    return downscale(normalize(image), max_edge)
+
+
+def encode_jpeg(image: Image.Image, quality: int = 85) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
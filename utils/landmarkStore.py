@@ -0,0 +1,45 @@
+import io
+import os
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+# float16 keeps a 478x3 mesh under 3KB; normalized coordinates lose well under a pixel at phone resolutions
+LANDMARK_DTYPE = os.getenv("LANDMARK_DTYPE", "float16")  # float16 or float32
+
+KEY_PREFIX = "landmarks-"
+
+
+class StoredLandmarks(NamedTuple):
+    """What a job's landmarks file holds: enough to re-classify or re-draw without FaceMesh."""
+    landmarks: np.ndarray  # (N, 3) float32, normalized x, y, z
+    image_shape: Tuple[int, int]  # (h, w) of the EXIF-oriented image
+    face_shape: str  # classification at the time the file was written
+
+
+def landmarks_key(unique_key: str) -> str:
+    return f"{KEY_PREFIX}{unique_key}.npz"
+
+
+def unique_key(landmarks_key: str) -> str:
+    return landmarks_key[len(KEY_PREFIX):-len(".npz")]
+
+
+def serialize(landmarks, image_shape, face_shape: str, dtype: str = LANDMARK_DTYPE) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        landmarks=np.asarray(landmarks, dtype=dtype),
+        image_shape=np.asarray(image_shape[:2], dtype=np.int32),
+        face_shape=np.array(face_shape),
+    )
+    return buffer.getvalue()
+
+
+def deserialize(data: bytes) -> StoredLandmarks:
+    with np.load(io.BytesIO(data), allow_pickle=False) as stored:
+        return StoredLandmarks(
+            landmarks=stored["landmarks"].astype(np.float32),
+            image_shape=tuple(int(x) for x in stored["image_shape"]),
+            face_shape=str(stored["face_shape"]),
+        )
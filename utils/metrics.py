@@ -0,0 +1,74 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Stages run from a few ms (classify) to tens of seconds (Gemini with retries)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "mog_stage_seconds", "Time spent in each /mog pipeline stage", ["stage"], buckets=STAGE_BUCKETS
+)
+RESULT_CACHE_LOOKUPS = Counter(
+    "mog_result_cache_lookups", "Result cache lookups by outcome", ["result"]
+)
+MOG_COALESCED = Counter(
+    "mog_coalesced",
+    "/mog requests that reused other work: a 'stored' result, or an in-flight run for the same 'key' or 'image'",
+    ["reason"],
+)
+ARTIFACT_LOOKUPS = Counter(
+    "artifact_store_lookups", "Local artifact store reads before falling back to S3", ["namespace", "result"]
+)
+ARTIFACT_WRITE_ERRORS = Counter(
+    "artifact_store_write_errors", "Local artifact store writes that failed (e.g. disk full); S3 still served", ["namespace"]
+)
+WORKER_POOL_RESTARTS = Counter(
+    "mog_worker_pool_restarts", "Times the /mog worker process pool was rebuilt after a worker died"
+)
+NO_FACE = Counter("mog_no_face", "/mog requests where FaceMesh found no face")
+GEMINI_PARSE_FALLBACKS = Counter(
+    "gemini_parse_fallbacks",
+    "Gemini replies that needed fixing: JSON 'extracted' from surrounding text or left 'unparsed', "
+    "and invalid analyses 'repaired' by a re-ask or 'defaulted' to placeholders",
+    ["outcome"],
+)
+GEMINI_QUEUE_SECONDS = Histogram(
+    "gemini_queue_seconds", "Time a Gemini call waited for quota and a concurrency slot", ["lane"],
+    buckets=STAGE_BUCKETS,
+)
+GEMINI_QUEUE_DEPTH = Gauge("gemini_queue_depth", "Gemini calls waiting for the scheduler", ["lane"])
+GEMINI_TOKENS = Counter(
+    "gemini_tokens", "Tokens charged to the TPM budget: reported usage, or the estimate without one", ["lane"]
+)
+UPLOADS_REJECTED = Counter(
+    "upload_rejected", "/upload requests refused before the image was stored", ["reason"]
+)
+STARTUP_SECONDS = Gauge(
+    "mog_startup_seconds", "Time to import api.py and to run its startup hook", ["phase"]
+)
+
+
+@contextmanager
+def timed(stage: str, timings: Optional[Dict[str, float]] = None):
+    """Time the block as one stage.
+
+    Observes the stage histogram directly, or adds to timings[stage] instead so
+    worker processes can hand their numbers back to the API process.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if timings is None:
+            STAGE_SECONDS.labels(stage).observe(elapsed)
+        else:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def observe(timings: Dict[str, float]):
+    """Feed stage timings collected with timed(..., timings) into the histogram."""
+    for stage, elapsed in timings.items():
+        STAGE_SECONDS.labels(stage).observe(elapsed)
@@ -0,0 +1,156 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "cache")
+RESULT_CACHE_MEMORY_ITEMS = int(os.getenv("RESULT_CACHE_MEMORY_ITEMS", 128))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+
+@dataclass
+class CachedResult:
+    """Everything /mog needs to rebuild a report without FaceMesh or Gemini."""
+    face_shape: str
+    landmarks: np.ndarray
+    analysis: Dict[str, Any]
+    mesh: bytes
+    mesh_content_type: str = "image/png"
+
+
+def cache_key(image_bytes: bytes, model_name: str, prompt_version: str) -> str:
+    """Content address of an analysis: the image bytes plus what produced the result."""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(f"\0{model_name}\0{prompt_version}".encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier (in-process LRU + on-disk) cache of /mog results.
+
+    The disk tier stores one .npz per key and evicts least recently used
+    entries once the directory grows past max_bytes. Its size is measured by
+    load(), from api.startup() or on the first write, so importing the module
+    never scans the directory.
+    """
+
+    def __init__(
+        self,
+        directory: str = RESULT_CACHE_DIR,
+        max_items: int = RESULT_CACHE_MEMORY_ITEMS,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+    ):
+        self.directory = directory
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self._loaded = False
+
+    def load(self):
+        """Create the directory and measure what is already in it; cheap once done."""
+        with self._lock:
+            self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        # Caller holds the lock
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._disk_bytes = sum(entry.stat().st_size for entry in self._entries())
+        self._loaded = True
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(".npz")]
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                return result
+
+        result = self._read(key)
+        if result is not None:
+            self._remember(key, result)
+        return result
+
+    def put(self, key: str, result: CachedResult):
+        self._remember(key, result)
+        self._write(key, result)
+
+    def _remember(self, key: str, result: CachedResult):
+        with self._lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def _read(self, key: str) -> Optional[CachedResult]:
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                result = CachedResult(
+                    face_shape=meta["face_shape"],
+                    landmarks=data["landmarks"],
+                    analysis=meta["analysis"],
+                    mesh=data["mesh"].tobytes(),
+                    mesh_content_type=meta["mesh_content_type"],
+                )
+            # Bump the mtime so eviction order follows reads, not just writes
+            os.utime(path)
+        except (KeyError, ValueError, OSError):
+            return None
+        return result
+
+    def _write(self, key: str, result: CachedResult):
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            landmarks=np.asarray(result.landmarks, dtype=np.float32),
+            mesh=np.frombuffer(result.mesh, dtype=np.uint8),
+            meta=np.array(json.dumps({
+                "face_shape": result.face_shape,
+                "analysis": result.analysis,
+                "mesh_content_type": result.mesh_content_type,
+            })),
+        )
+        data = buffer.getvalue()
+
+        path = self._path(key)
+        with self._lock:
+            self._ensure_loaded()
+        # Unique per write, so processes sharing the directory never collide on a temp name
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        with self._lock:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._disk_bytes += len(data) - previous
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Caller holds the lock
+        for entry in sorted(self._entries(), key=lambda e: e.stat().st_mtime):
+            if self._disk_bytes <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._disk_bytes -= size
@@ -1,20 +1,50 @@
-import boto3
+import asyncio
+import io
 from dotenv import load_dotenv
 import os
-from botocore.client import Config  
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# boto3 is imported when the first client is built; importing it and creating
+# a client takes a few hundred ms that shouldn't land on API cold start
 
 load_dotenv(override=True)
 
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # e.g. a local moto server for tests
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32))
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024))
+PRESIGNED_URL_EXPIRY = 18000
+# Multipart parts buffered or in flight per streamed upload (each is S3_MULTIPART_THRESHOLD bytes)
+S3_STREAM_INFLIGHT_PARTS = int(os.getenv("S3_STREAM_INFLIGHT_PARTS", 2))
+
+
+def _client(**config):
+    import boto3
+    from botocore.client import Config
+    return boto3.client('s3',
+        region_name="ap-southeast-1",
+        endpoint_url=S3_ENDPOINT_URL,
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        config=Config(signature_version='v4', **config)
+    )
+
+
 class s3Helper: 
     
     BUCKET_NAME: str = "sigma-boi-bucket"  # static
 
-    s3: object = boto3.client('s3', 
-        region_name="ap-southeast-1",
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"), 
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        config=Config(signature_version='v4')
-    ) # s3 client
+    _s3 = None  # shared s3 client, built on first use
+    _s3_lock = threading.Lock()
+
+    @property
+    def s3(self):
+        if s3Helper._s3 is None:
+            with s3Helper._s3_lock:
+                if s3Helper._s3 is None:
+                    s3Helper._s3 = _client()
+        return s3Helper._s3
 
     def upload(self, image_path: str, key: str, prompt: str = None, advice: str = None) -> str:
         """ Upload image of user to s3 bucket so that ai model and pull, return string url""" 
@@ -66,4 +96,214 @@ class s3Helper:
 
         # The response contains the presigned URL
         return response
-        
+
+
+class asyncS3Helper:
+    """Async S3 access for the API handlers.
+
+    Uses one pooled boto3 client; blocking transfers run on a dedicated thread
+    pool sized to the connection pool so they never stall the event loop, and
+    large bodies go up as concurrent multipart uploads.
+    """
+
+    BUCKET_NAME: str = s3Helper.BUCKET_NAME
+
+    def __init__(self, client=None, max_pool_connections: int = S3_MAX_POOL_CONNECTIONS,
+                 multipart_threshold: int = S3_MULTIPART_THRESHOLD):
+        self._s3 = client
+        self._max_pool_connections = max_pool_connections
+        self._multipart_threshold = multipart_threshold
+        self._transfer_config = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_pool_connections, thread_name_prefix="s3")
+
+    @property
+    def s3(self):
+        """The pooled client, built on first use (or by warm_up)."""
+        if self._s3 is None:
+            with self._lock:
+                if self._s3 is None:
+                    self._s3 = _client(
+                        max_pool_connections=self._max_pool_connections,
+                        tcp_keepalive=True,
+                        retries={"mode": "adaptive", "max_attempts": 5},
+                    )
+        return self._s3
+
+    def warm_up(self):
+        """Build the client and transfer config ahead of the first request."""
+        self.s3
+        self._transfer()
+
+    def _transfer(self):
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+            self._transfer_config = TransferConfig(
+                multipart_threshold=self._multipart_threshold,
+                multipart_chunksize=self._multipart_threshold,
+                max_concurrency=4,
+            )
+        return self._transfer_config
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def _call(self, method: str, *args, **kwargs):
+        """Call self.s3.<method> on the executor, looking the client up there so building it never blocks the loop"""
+        return await self._run(lambda: getattr(self.s3, method)(*args, **kwargs))
+
+    def generate_presigned_url(self, key: str, expires_in: int = PRESIGNED_URL_EXPIRY) -> str:
+        """Sign a GET url locally; no request is made, but the first call builds the client (see presign)"""
+        return self.s3.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.BUCKET_NAME, 'Key': key},
+            ExpiresIn=expires_in
+        )
+
+    async def presign(self, key: str, expires_in: int = PRESIGNED_URL_EXPIRY) -> str:
+        """generate_presigned_url for the event loop: a client not built yet is built on the executor"""
+        if self._s3 is None:
+            await self._run(lambda: self.s3)
+        return self.generate_presigned_url(key, expires_in)
+
+    async def download_bytes(self, key: str) -> bytes:
+        def read():
+            return self.s3.get_object(Bucket=self.BUCKET_NAME, Key=key)["Body"].read()
+        return await self._run(read)
+
+    async def head(self, key: str):
+        """The object's metadata (LastModified, ContentLength, ...), or None if key doesn't exist"""
+        def read():
+            try:
+                return self.s3.head_object(Bucket=self.BUCKET_NAME, Key=key)
+            except self.s3.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                    return None
+                raise
+        return await self._run(read)
+
+    async def upload_bytes(self, data: bytes, key: str, content_type: str = "image/png",
+                           prompt: str = None, advice: str = None) -> str:
+        """Upload an in-memory object (multipart above the threshold), return presigned url"""
+        def upload():
+            self.s3.upload_fileobj(
+                io.BytesIO(data),
+                self.BUCKET_NAME,
+                key,
+                ExtraArgs={
+                    "ContentType": content_type,
+                    "Metadata": {"prompt": prompt or "", "advice": advice or ""},
+                },
+                Config=self._transfer(),
+            )
+        await self._run(upload)
+        return self.generate_presigned_url(key)
+
+    async def upload_stream(self, chunks, key: str, content_type: str = "image/png",
+                            prompt: str = None, advice: str = None) -> str:
+        """Upload an async iterable of byte chunks without holding the whole body, return presigned url
+
+        Bodies that stay under the multipart threshold go up in one put_object;
+        anything larger becomes a multipart upload with at most
+        S3_STREAM_INFLIGHT_PARTS parts buffered, so memory stays flat. A failure
+        (including one raised by chunks) aborts the multipart upload.
+        """
+        part_size = max(self._multipart_threshold, 5 * 1024 * 1024)  # S3's minimum part size
+        extra = {"ContentType": content_type, "Metadata": {"prompt": prompt or "", "advice": advice or ""}}
+        buffer = bytearray()
+        upload_id = None
+        part_number = 0
+        parts = []
+        inflight = set()
+
+        async def send_part(number: int, body: bytes):
+            response = await self._call(
+                "upload_part",
+                Bucket=self.BUCKET_NAME, Key=key, UploadId=upload_id, PartNumber=number, Body=body,
+            )
+            parts.append({"PartNumber": number, "ETag": response["ETag"]})
+
+        async def flush(body: bytes):
+            nonlocal upload_id, part_number
+            if upload_id is None:
+                response = await self._call("create_multipart_upload", Bucket=self.BUCKET_NAME, Key=key, **extra)
+                upload_id = response["UploadId"]
+            if len(inflight) >= S3_STREAM_INFLIGHT_PARTS:
+                done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                inflight.difference_update(done)
+                for task in done:
+                    task.result()
+            part_number += 1
+            inflight.add(asyncio.create_task(send_part(part_number, body)))
+
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                while len(buffer) >= part_size:
+                    body = bytes(buffer[:part_size])
+                    del buffer[:part_size]
+                    await flush(body)
+
+            if upload_id is None:
+                await self._call("put_object", Bucket=self.BUCKET_NAME, Key=key, Body=bytes(buffer), **extra)
+            else:
+                if buffer:
+                    await flush(bytes(buffer))
+                await asyncio.gather(*inflight)
+                await self._call(
+                    "complete_multipart_upload",
+                    Bucket=self.BUCKET_NAME, Key=key, UploadId=upload_id,
+                    MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])},
+                )
+        except BaseException:
+            for task in inflight:
+                task.cancel()
+            if upload_id is not None:
+                await self._call("abort_multipart_upload", Bucket=self.BUCKET_NAME, Key=key, UploadId=upload_id)
+            raise
+        return self.generate_presigned_url(key)
+
+    async def move(self, source: str, key: str, content_type: str, prompt: str = None, advice: str = None) -> str:
+        """Server-side copy source to key (replacing its metadata) and delete source, return presigned url"""
+        await self._call(
+            "copy_object",
+            Bucket=self.BUCKET_NAME, Key=key, CopySource={"Bucket": self.BUCKET_NAME, "Key": source},
+            MetadataDirective="REPLACE", ContentType=content_type,
+            Metadata={"prompt": prompt or "", "advice": advice or ""},
+        )
+        await self.delete(source)
+        return self.generate_presigned_url(key)
+
+    async def delete(self, key: str):
+        await self._call("delete_object", Bucket=self.BUCKET_NAME, Key=key)
+
+    async def upload_text(self, text: str, unique_key: str) -> str:
+        """Upload the guidance text for unique_key"""
+        return await self.upload_bytes(
+            text.encode("utf-8"), f"guidance-{unique_key}.txt", content_type="text/plain; charset=utf-8"
+        )
+
+    async def upload_many(self, objects) -> list:
+        """Upload (data, key, content_type) tuples concurrently, return their presigned urls"""
+        return await asyncio.gather(
+            *[self.upload_bytes(data, key, content_type) for data, key, content_type in objects]
+        )
+
+    async def download_many(self, keys) -> list:
+        return await asyncio.gather(*[self.download_bytes(key) for key in keys])
+
+    async def list_keys(self, prefix: str = "", page_size: int = 1000):
+        """Yield the keys under prefix one listing page (up to page_size keys) at a time"""
+        kwargs = {"Bucket": self.BUCKET_NAME, "Prefix": prefix, "MaxKeys": page_size}
+        while True:
+            page = await self._call("list_objects_v2", **kwargs)
+            keys = [item["Key"] for item in page.get("Contents", [])]
+            if keys:
+                yield keys
+            if not page.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,64 @@
+import asyncio
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Dict, Hashable, List
+
+
+class _Flight:
+    """One run of an event generator, recorded so late joiners can replay it."""
+
+    def __init__(self, events: AsyncIterator, on_done: Callable[[], None]):
+        self.events: List = []
+        self.done = False
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        # Not owned by any caller: a follower disconnecting doesn't cancel the shared work
+        self.task = asyncio.create_task(self._run(events))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, events: AsyncIterator):
+        try:
+            async with aclosing(events):
+                async for event in events:
+                    self.events.append(event)
+                    self._notify()
+        finally:
+            self.done = True
+            self._on_done()
+            self._notify()
+
+    async def follow(self) -> AsyncIterator:
+        seen = 0
+        while True:
+            while seen < len(self.events):
+                yield self.events[seen]
+                seen += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """At most one in-flight run per key; concurrent callers for a key share it.
+
+    follow(key, start) calls start() only if nothing is running for key, and
+    every caller gets the run's full event sequence from the beginning. The
+    key is free again as soon as the run ends.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def follow(self, key: Hashable, start: Callable[[], AsyncIterator]) -> AsyncIterator:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(start(), lambda: self._flights.pop(key, None))
+        return flight.follow()
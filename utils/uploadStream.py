@@ -0,0 +1,167 @@
+import io
+import os
+from typing import AsyncIterator, Tuple
+
+from PIL import Image
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from utils import imagePrep
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", 50_000_000))
+# Give up on identifying the image if the header isn't parsed within this many bytes
+UPLOAD_SNIFF_BYTES = 256 * 1024
+# Plain form fields (key, prompt) are small; anything bigger is not a real client
+UPLOAD_MAX_FIELD_BYTES = 64 * 1024
+UPLOAD_FORMATS = {"JPEG", "MPO", "PNG", "WEBP"}
+
+
+class UploadRejected(Exception):
+    """The request was refused before (or while) its body was read."""
+
+    def __init__(self, status_code: int, reason: str, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+        self.message = message
+
+
+async def iter_form(request) -> AsyncIterator[Tuple]:
+    """Parse a multipart/form-data body as it arrives, without spooling files.
+
+    Yields ("field", name, value) for plain fields and, for each file,
+    ("file", name, filename, content_type), then ("data", chunk)... and ("end",).
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadRejected(400, "bad_form", "Expected a multipart/form-data body")
+
+    events = []
+    part = {}
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, field=b"", value=b"", data=bytearray())
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"] = part["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = disposition.get(b"filename")
+        part["is_file"] = filename is not None
+        if part["is_file"]:
+            events.append((
+                "file",
+                part["name"],
+                filename.decode("utf-8", "replace"),
+                part["headers"].get(b"content-type", b"").decode("latin-1"),
+            ))
+
+    def on_part_data(data, start, end):
+        if part["is_file"]:
+            events.append(("data", data[start:end]))
+            return
+        part["data"] += data[start:end]
+        if len(part["data"]) > UPLOAD_MAX_FIELD_BYTES:
+            raise UploadRejected(400, "bad_form", f"Form field {part['name']!r} is too large")
+
+    def on_part_end():
+        if part["is_file"]:
+            events.append(("end",))
+        else:
+            events.append(("field", part["name"], part["data"].decode("utf-8", "replace")))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    async for chunk in request.stream():
+        parser.write(chunk)
+        for event in events:
+            yield event
+        events.clear()
+    parser.finalize()
+    for event in events:
+        yield event
+
+
+class ImageStream:
+    """The body of one file part, checked as it streams.
+
+    sniff() reads just enough of the part to identify the image and check its
+    dimensions; iterating then yields the whole body (sniffed bytes first) while
+    enforcing max_bytes. Problems raise UploadRejected without reading the rest.
+    """
+
+    def __init__(self, form, max_bytes: int = UPLOAD_MAX_BYTES, max_pixels: int = UPLOAD_MAX_PIXELS):
+        self._form = form
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.size = 0
+        self.format = None
+        self.dimensions = None
+        self._head = bytearray()
+        self._ended = False
+
+    @property
+    def content_type(self) -> str:
+        return imagePrep.mime_type(self.format, "application/octet-stream")
+
+    async def _next_chunk(self):
+        """The next chunk of this part, or None at its end."""
+        try:
+            event = await anext(self._form)
+        except StopAsyncIteration:
+            raise UploadRejected(400, "bad_form", "Upload ended mid-file") from None
+        if event[0] == "end":
+            self._ended = True
+            return None
+        self.size += len(event[1])
+        if self.size > self.max_bytes:
+            raise UploadRejected(413, "too_large", f"Image is larger than {self.max_bytes} bytes")
+        return event[1]
+
+    async def sniff(self):
+        while True:
+            chunk = await self._next_chunk()
+            if chunk is None:
+                break
+            self._head += chunk
+            try:
+                with Image.open(io.BytesIO(self._head)) as image:
+                    self.format, self.dimensions = image.format, image.size
+                break
+            except Image.DecompressionBombError:
+                raise UploadRejected(413, "too_large", "Image has too many pixels") from None
+            except Exception:
+                # Header not complete yet (or not an image); keep reading up to the limit
+                if len(self._head) >= UPLOAD_SNIFF_BYTES:
+                    break
+
+        if self.format not in UPLOAD_FORMATS:
+            raise UploadRejected(415, "not_image", "Upload a JPEG, PNG or WebP image")
+        width, height = self.dimensions
+        if width * height > self.max_pixels:
+            raise UploadRejected(413, "too_large", f"Image is {width}x{height}; the limit is {self.max_pixels} pixels")
+
+    async def __aiter__(self):
+        yield bytes(self._head)
+        self._head = bytearray()
+        while not self._ended:
+            chunk = await self._next_chunk()
+            if chunk is not None:
+                yield chunk